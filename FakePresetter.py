@@ -0,0 +1,92 @@
+"""Stand-in for a tool presetter, for trying out the presetter service.
+
+    python ToolLoader.py presetter --port 7878 &
+    python FakePresetter.py --port 7878 --count 300
+    python FakePresetter.py --socket /tmp/toolloader.sock --bad 5
+    python FakePresetter.py --folder presetter          # drop a CSV file instead
+
+Measurements are made up for tools of library.csv: a length between 30 and
+150 and the library diameter give or take a little, in --units. --bad adds
+lines the service should reject, to see the error replies.
+"""
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+import ToolLibrary
+import ToolPresetter
+import ToolUnits
+
+SCRIPT_DIRECTORY = Path(__file__).parent
+
+
+def measurement_lines(library_path, units, count, bad, seed):
+    random.seed(seed)
+    tools = ToolLibrary.load_library(library_path)
+    if not tools:
+        sys.exit(f"no tools in {library_path}")
+    columns = ToolUnits.ToolColumns(tools, units)
+    lines = ["tool,length,diameter"]
+    for _ in range(count):
+        tool_number = random.choice(columns.tool_numbers)
+        diameter = columns.diameter[columns.rows[tool_number]]
+        measured = '' if diameter != diameter or diameter <= 0 else \
+            ToolUnits.format_length(diameter * random.uniform(0.995, 1.005), units)
+        lines.append(f"{tool_number},{ToolUnits.format_length(random.uniform(30, 150), units)},{measured}")
+    for _ in range(bad):
+        lines.insert(random.randrange(1, len(lines) + 1), random.choice(
+            ["99999,50,", "T5,abc,", "5,,", "x,1,2", f"{random.choice(columns.tool_numbers)},50,-1"]))
+    return [line + "\n" for line in lines]
+
+
+async def send(lines, host, port, socket_path):
+    if socket_path:
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    for line in lines:
+        writer.write(line.encode())
+    await writer.drain()
+    writer.write_eof()  # The service answers "OK <accepted>" once it sees the end
+    replies = (await reader.read()).decode()
+    writer.close()
+    return replies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--port", type=int, help="TCP port of the presetter service")
+    target.add_argument("--socket", type=Path, help="Unix socket of the presetter service")
+    target.add_argument("--folder", type=Path, help="drop folder to write a CSV file into")
+    parser.add_argument("--host", default=ToolPresetter.DEFAULT_HOST)
+    parser.add_argument("--library", type=Path, default=SCRIPT_DIRECTORY / "library.csv")
+    parser.add_argument("--units", default=ToolUnits.MILLIMETERS, help="unit of the measurements (default: mm)")
+    parser.add_argument("--count", type=int, default=300, help="measurements to send (default: 300)")
+    parser.add_argument("--bad", type=int, default=0, help="invalid lines to mix in")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    units = ToolUnits.unit_of(args.units)
+    if units is None:
+        parser.error(f"--units must be mm or inch, not {args.units!r}")
+    lines = measurement_lines(args.library, units, args.count, args.bad, args.seed)
+
+    if args.folder:
+        # Write under another name and rename, so the service never sees half a file
+        args.folder.mkdir(parents=True, exist_ok=True)
+        path = args.folder / f"measurements-{random.randrange(10 ** 6):06}.csv"
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(''.join(lines))
+        temp_path.replace(path)
+        print(f"wrote {len(lines) - 1} lines to {path}")
+        return 0
+
+    print(asyncio.run(send(lines, args.host, args.port, args.socket)), end='')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
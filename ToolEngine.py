@@ -0,0 +1,571 @@
+import argparse
+import csv
+import math
+import sys
+from collections import namedtuple
+from pathlib import Path
+
+import ToolGeometry
+import ToolLayout
+import ToolLibrary
+import ToolOptimizer
+import ToolPresetter
+import ToolSearch
+import ToolState
+import ToolTable
+import ToolTrace
+import ToolUnits
+
+SCRIPT_DIRECTORY = Path(__file__).parent
+
+# Placeholder tools written into pockets that don't hold a selected tool
+DISABLED_TOOL = ToolTable.tool_entry("503", "Pocket Disabled", "0", "0")
+EMPTY_TOOL = ToolTable.tool_entry("404", "Empty", "0", "0")
+
+# One row of the pocket layout; the first five fields are the Treeview columns
+LayoutRow = namedtuple("LayoutRow", "pocket tool_number description diameter comment tag")
+
+
+def parse_config(config_path):
+    config = {}
+    with open(config_path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            key, value = line.strip().split(': ')
+            config[key] = value
+    # Convert values to appropriate types
+    config['Total Pockets'] = int(config['Total Pockets'])
+    config['Disabled Pockets'] = [int(x) for x in config['Disabled Pockets'].split(',')] if config['Disabled Pockets'] else []
+    config['Tool Changer Range'] = tuple(int(x) for x in config['Tool Changer Range'].split('-'))
+    config['Manual Tool Range'] = tuple(int(x) for x in config['Manual Tool Range'].split('-'))
+    # Unit of tool.tbl and the tool list; tools in the other unit are converted. There is no default:
+    # guessing wrong would scale every exported diameter by 25.4
+    machine_units = config.get('Machine Units', '')
+    config['Machine Units'] = ToolUnits.unit_of(machine_units)
+    if config['Machine Units'] is None:
+        raise ValueError(f"{config_path}: Machine Units must be mm or inch, not {machine_units!r}")
+    # Carousel geometry for the interference check, in machine units; without it there is no check
+    for key in ('Pocket Pitch', 'Carousel Radius'):
+        config[key] = float(config[key]) if config.get(key) else None
+    # Where a tool presetter can send measurements; each is optional
+    config['Presetter Port'] = int(config['Presetter Port']) if config.get('Presetter Port') else None
+    return config
+
+
+def complete_order(tool_order, csv_data):
+    """`tool_order` followed by the library tools it doesn't list yet."""
+    order = list(tool_order)
+    listed = set(order)
+    order.extend(tool_number for tool_number in csv_data if tool_number not in listed)
+    return order
+
+
+def tool_row(pocket, tool_number, tool, tag, columns):
+    diameter = columns.length('diameter', tool_number)
+    return LayoutRow(pocket, tool_number, tool.description, f"{diameter} {columns.unit}" if diameter else "",
+                     tool.comment, tag)
+
+
+def export_entry(tool_number, tool, columns):
+    return ToolTable.tool_entry(tool_number, tool.description, columns.length('diameter', tool_number), tool.comment)
+
+
+def build_layout(config, csv_data, tool_order, columns):
+    """Assign carousel pockets to the tools in the tool changer range.
+
+    Tools are placed in `tool_order`, skipping disabled pockets; "" in the
+    order leaves a pocket empty (past the carousel, an empty rack row). Tools
+    left over once the carousel is full become rack rows without a pocket, and unused
+    pockets are padded with empty rows. Diameters are shown from `columns`
+    (ToolUnits.ToolColumns), in the machine's unit; Z offsets as stored.
+    """
+    total_pockets = config['Total Pockets']
+    disabled_pockets = set(config['Disabled Pockets'])
+    tool_changer_range_start, tool_changer_range_end = config['Tool Changer Range']
+
+    rows = []
+    row_number = 1
+    for tool_number in tool_order:
+        if tool_number == '':
+            # An empty pocket saved in the tool order keeps its place in the carousel
+            while row_number <= total_pockets and row_number in disabled_pockets:
+                rows.append(LayoutRow(row_number, "503", "Pocket Disabled", "0", "0", 'disabled'))
+                row_number += 1
+            if row_number <= total_pockets:
+                rows.append(LayoutRow(row_number, "", "", "", "", 'empty'))
+                row_number += 1
+            else:
+                # One dragged past the carousel stays among the rack rows, so the saved order rebuilds as it was
+                rows.append(LayoutRow('', "", "", "", "", 'empty'))
+            continue
+        tool = csv_data.get(tool_number)
+        if not tool or not tool_changer_range_start <= int(tool_number) <= tool_changer_range_end:
+            continue
+        while row_number <= total_pockets and row_number in disabled_pockets:
+            rows.append(LayoutRow(row_number, "503", "Pocket Disabled", "0", "0", 'disabled'))
+            row_number += 1
+        if row_number <= total_pockets:
+            rows.append(tool_row(row_number, tool_number, tool, 'carousel', columns))
+            row_number += 1
+        else:
+            rows.append(tool_row('', tool_number, tool, 'rack', columns))
+
+    # Fill the remaining pockets with empty values if there are any left within the total pockets range
+    while row_number <= total_pockets:
+        if row_number in disabled_pockets:
+            rows.append(LayoutRow(row_number, "503", "Pocket Disabled", "0", "0", 'disabled'))
+        else:
+            rows.append(LayoutRow(row_number, "", "", "", "", 'empty'))
+        row_number += 1
+    return rows
+
+
+def build_export(config, csv_data, selected_rows, columns):
+    """Return the tool.tbl entries for a selection, one per carousel pocket then the manual tools.
+
+    `selected_rows` are (pocket, tool number, ...) tuples; every carousel
+    pocket not covered by a selection is written as "Empty" or "Pocket
+    Disabled" so the pocket numbering stays intact. Diameters come from
+    `columns`, in the machine's unit; Z offsets are written as stored.
+    """
+    # Prepare the initial list of tools for export, defaulting to "Empty"
+    total_pockets = config['Total Pockets']
+    export_data = [EMPTY_TOOL for _ in range(total_pockets)]
+
+    # Mark disabled pockets
+    for pocket in config['Disabled Pockets']:
+        if pocket <= total_pockets:  # Only consider disabled pockets within the total pockets range
+            export_data[pocket - 1] = DISABLED_TOOL  # Adjust indices for 0-based indexing
+
+    # Process selected rows for export
+    for pocket_number, tool_number, *_ in selected_rows:
+        tool_number = str(tool_number)
+        if pocket_number == '' or tool_number not in csv_data:
+            continue  # Rack tools and empty pockets have nothing to place
+        pocket_index = int(pocket_number) - 1  # Convert to 0-based index
+        if pocket_index < total_pockets:
+            # Update the export data for the selected pocket
+            export_data[pocket_index] = export_entry(tool_number, csv_data[tool_number], columns)
+
+    # Append tools from the Manual Tool Range that aren't already in the carousel
+    manual_tool_range_start, manual_tool_range_end = config['Manual Tool Range']
+    exported_tools = {entry.tool_number for entry in export_data}
+
+    for tool_number, tool in csv_data.items():
+        if manual_tool_range_start <= int(tool_number) <= manual_tool_range_end and tool_number not in exported_tools:
+            export_data.append(export_entry(tool_number, tool, columns))
+            exported_tools.add(tool_number)
+    return export_data
+
+
+class ToolEngine:
+    """Tool library, pocket layout and tool.tbl export for one machine, without Tk.
+
+    library.csv and tool.tbl default to the directory holding the config file.
+    The tool order is kept per config, in ToolState's journal next to it, so
+    several machines can share one library.
+    """
+
+    def __init__(self, config_path=None, library_path=None, tool_table_path=None, state_path=None):
+        self.config_path = Path(config_path) if config_path else SCRIPT_DIRECTORY / "ToolLoader.config"
+        machine_directory = self.config_path.parent
+        self.library_path = Path(library_path) if library_path else machine_directory / "library.csv"
+        self.tool_table_path = Path(tool_table_path) if tool_table_path else machine_directory / "tool.tbl"
+        self.state_path = Path(state_path) if state_path else ToolState.state_path_for(self.config_path)
+        self.state = ToolState.LayoutState(self.state_path)
+
+        self.config = {}
+        self.csv_data = {}
+        self.columns = ToolUnits.ToolColumns({})
+        self.index = ToolSearch.ToolIndex()
+        self.envelopes = ToolGeometry.ToolEnvelopes()
+        self.rows = []
+        self.layout = ToolLayout.PocketLayout()
+
+    def load(self):
+        # Update library.csv with any Z values from existing tool.tbl
+        with ToolTrace.span("read_tool_table"):
+            z_values = ToolTable.read_z_values(self.tool_table_path)
+        with ToolTrace.span("merge_z_offsets") as span:
+            self.csv_data, changed = ToolLibrary.merge_z_offsets(self.library_path, z_values)
+            span["tools"], span["changed"] = len(self.csv_data), len(changed)
+        with ToolTrace.span("parse_config"):
+            self.config = parse_config(self.config_path)
+        with ToolTrace.span("normalize_units"):
+            self.columns = ToolUnits.ToolColumns(self.csv_data, self.config['Machine Units'])
+        with ToolTrace.span("search_index"):
+            self.index = ToolSearch.ToolIndex(self.csv_data, self.columns)
+        self.envelopes = ToolGeometry.ToolEnvelopes(self.csv_data, self.config['Machine Units'])
+        with ToolTrace.span("load_state") as span:
+            # Before there was a state per config, the order was in ToolLoaderState.csv
+            self.state.load([self.config_path.parent / ToolState.LEGACY_STATE, Path(ToolState.LEGACY_STATE)])
+            span["records"] = self.state.records
+        with ToolTrace.span("build_layout") as span:
+            self.rows = build_layout(self.config, self.csv_data, complete_order(self.state.order or [], self.csv_data),
+                                     self.columns)
+            span["rows"] = len(self.rows)
+        self.layout = ToolLayout.PocketLayout(self.rows)
+        self.state.resume(self.layout)
+        return self
+
+    @property
+    def max_selections(self):
+        return self.config['Total Pockets'] - len(self.config['Disabled Pockets'])
+
+    def carousel_rows(self):
+        """The rows occupying the carousel, as selected by "Export All"."""
+        return self.rows[:self.config['Total Pockets']]
+
+    def save_order(self):
+        """Write the moves and selections journaled since the last save."""
+        self.state.flush(self.layout.tools)
+
+    def apply_order(self, tool_order):
+        """Lay the tools out in `tool_order` (library tools it misses go last) and save it."""
+        self.rows = build_layout(self.config, self.csv_data, complete_order(tool_order, self.csv_data), self.columns)
+        self.layout = ToolLayout.PocketLayout(self.rows)
+        self.state.compact(self.layout.tools)
+
+    def move_rows(self, positions, target):
+        """Move the tools in rows `positions` as a block so the first lands on row `target`.
+
+        The tools in between shift along, skipping disabled pockets. Returns a
+        ToolLayout.Change naming the rows to redraw, or None if nothing moved.
+        The move is journaled; save_order() writes it.
+        """
+        change = self.layout.move(positions, target)
+        if change:
+            self.state.record_move("move", self.layout.journal[self.layout.applied - 1])
+        return self.render(change)
+
+    def undo(self):
+        change = self.layout.undo()
+        if change:
+            self.state.record_move("undo", self.layout.journal[self.layout.applied])
+        return self.render(change)
+
+    def redo(self):
+        change = self.layout.redo()
+        if change:
+            self.state.record_move("redo", self.layout.journal[self.layout.applied - 1])
+        return self.render(change)
+
+    @property
+    def selection(self):
+        """Tool numbers selected when the state was last saved."""
+        return self.state.selection
+
+    def select(self, tool_numbers):
+        self.state.record_selection(tool_numbers)
+
+    def render(self, change):
+        """Rebuild the rows a layout change touched, in place."""
+        if change is None:
+            return None
+        for position in change.changed:
+            pocket = self.rows[position].pocket
+            tool_number = self.layout.tool_at(position)
+            if tool_number == '':
+                self.rows[position] = LayoutRow(pocket, "", "", "", "", 'empty')
+            else:
+                self.rows[position] = tool_row(pocket, tool_number, self.csv_data[tool_number],
+                                               'carousel' if pocket != '' else 'rack', self.columns)
+        return change
+
+    def carousel(self):
+        return ToolOptimizer.Carousel(self.config['Total Pockets'], self.config['Disabled Pockets'])
+
+    def optimize(self, programs, batch=False, workers=None):
+        """Plan pockets from the tool changes in NC `programs`.
+
+        Without `batch` the programs are one job and get a fresh layout; with
+        it they are run in the given order, starting from the tools loaded
+        now, and each job only loads what it is missing. Tools outside the
+        tool changer range or library are reported as manual. Returns JobPlans.
+        """
+        tool_changer_range_start, tool_changer_range_end = self.config['Tool Changer Range']
+        sequences = []
+        manual = []
+        with ToolTrace.span("scan_programs", programs=len(programs)):
+            scanned = ToolOptimizer.scan_programs(programs, workers)
+        for sequence in scanned:
+            carousel_tools = [tool for tool in sequence if tool in self.csv_data
+                              and tool_changer_range_start <= int(tool) <= tool_changer_range_end]
+            sequences.append(carousel_tools)
+            manual.append(sorted(set(sequence) - set(carousel_tools), key=int))
+
+        carousel = self.carousel()
+        if not batch:
+            plan = ToolOptimizer.optimize_job(carousel, sequences)
+            all_manual = sorted(set(plan.manual).union(*manual), key=int)
+            return [plan._replace(program=", ".join(str(program) for program in programs), manual=all_manual)]
+
+        loaded = {row.tool_number: row.pocket for row in self.rows if row.tag == 'carousel'}
+        plans = ToolOptimizer.optimize_batch(carousel, sequences, loaded, [str(program) for program in programs])
+        return [plan._replace(manual=plan.manual + job_manual) for plan, job_manual in zip(plans, manual)]
+
+    def apply_plan(self, plan):
+        """Load a JobPlan's pockets into the layout and the saved state."""
+        current_order = [row.tool_number for row in self.rows]
+        self.apply_order(ToolOptimizer.layout_order(self.carousel(), plan.pockets, current_order))
+
+    def pocket_distance(self):
+        """Spacing of neighbouring pocket axes, or None if the config doesn't describe the carousel."""
+        pocket_pitch, carousel_radius = self.config['Pocket Pitch'], self.config['Carousel Radius']
+        if pocket_pitch is None and carousel_radius is not None and self.config['Total Pockets']:
+            pocket_pitch = 2 * math.pi * carousel_radius / self.config['Total Pockets']
+        return None if pocket_pitch is None else ToolGeometry.pocket_distance(pocket_pitch, carousel_radius)
+
+    def interference(self, selected_rows=None):
+        """Check the tools in neighbouring pockets for collisions.
+
+        `selected_rows` are (pocket, tool number, ...) tuples, the whole
+        carousel by default. Returns a ToolGeometry.Interference, or None when
+        the config has no Pocket Pitch or Carousel Radius.
+        """
+        distance = self.pocket_distance()
+        if distance is None:
+            return None
+        total_pockets = self.config['Total Pockets']
+        disabled_pockets = set(self.config['Disabled Pockets'])
+        pocket_tools = [''] * total_pockets
+        for pocket, tool_number, *_ in self.carousel_rows() if selected_rows is None else selected_rows:
+            tool_number = str(tool_number)
+            if pocket != '' and int(pocket) <= total_pockets and int(pocket) not in disabled_pockets \
+                    and tool_number in self.csv_data:
+                pocket_tools[int(pocket) - 1] = tool_number
+        with ToolTrace.span("interference", pockets=total_pockets) as span:
+            result = self.envelopes.check(pocket_tools, distance)
+            span["pairs"] = len(result.pairs)
+        return result
+
+    def apply_z_offsets(self, z_values):
+        """Merge Z offsets touched off at the machine into the library and layout rows.
+
+        Returns the {tool number: Z offset} entries that actually changed.
+        """
+        _, changed = ToolLibrary.merge_z_offsets(self.library_path, z_values, self.csv_data)
+        if changed:
+            for tool_number in changed:
+                self.index.update(tool_number, self.csv_data[tool_number])
+            self.refresh_rows(changed)
+        return changed
+
+    def apply_measurements(self, measurements):
+        """Store presetter measurements (ToolPresetter.Measurement, in machine units) in library.csv and tool.tbl.
+
+        The length becomes the Z offset and the diameter replaces the
+        library's, converted to the tool's own unit. All of them go into one
+        library rewrite and one tool.tbl write; tools tool.tbl doesn't list
+        are only stored in the library. Returns the {tool number: {"comment"
+        and/or "diameter": text}} library values that changed.
+        """
+        unit = self.config['Machine Units']
+        library_values = {}
+        table_values = {}
+        for measurement in measurements:
+            tool = self.csv_data.get(measurement.tool_number)
+            if tool is None:
+                continue
+            values = library_values[measurement.tool_number] = {}
+            fields = table_values[measurement.tool_number] = {}
+            if measurement.length is not None:
+                values['comment'] = fields['Z'] = ToolLibrary.format_number(measurement.length)
+            if measurement.diameter is not None:
+                tool_unit = ToolUnits.unit_of(tool.unit, unit)
+                values['diameter'] = ToolUnits.format_length(ToolUnits.convert(measurement.diameter, unit, tool_unit),
+                                                             tool_unit)
+                fields['D'] = ToolUnits.format_length(measurement.diameter, unit)
+
+        with ToolTrace.span("apply_measurements", measurements=len(measurements)) as span:
+            changed = ToolLibrary.update_tools(self.library_path, library_values, self.csv_data)
+            span["written"] = ToolTable.update_entries(self.tool_table_path, table_values)
+            span["changed"] = len(changed)
+        for tool_number in changed:
+            self.index.update(tool_number, self.csv_data[tool_number])
+            self.columns.update(tool_number, self.csv_data[tool_number])
+            self.envelopes.forget(tool_number)
+        if any('diameter' in values for values in changed.values()):
+            self.index.sort_diameters()
+        self.refresh_rows(changed)
+        return changed
+
+    def refresh_rows(self, tool_numbers):
+        """Redraw the layout rows of `tool_numbers` from the library, in place; the GUI may still be inserting from this list."""
+        for position, row in enumerate(self.rows):
+            if row.tool_number in tool_numbers and row.tag in ('carousel', 'rack'):
+                self.rows[position] = tool_row(row.pocket, row.tool_number, self.csv_data[row.tool_number], row.tag,
+                                               self.columns)
+
+    def nominal_diameter(self, tool_number):
+        """A library tool's diameter in machine units as it stands now (NaN if unknown), None if there is no such tool."""
+        row = self.columns.rows.get(tool_number)
+        return None if row is None else float(self.columns.diameter[row])
+
+    def presetter(self, apply, port=None, socket_path=None, drop_folder=None):
+        """A ToolPresetter.PresetterService on the config's Presetter Port/Socket/Folder, or the ones given.
+
+        Relative paths are taken from the config's folder. `apply` receives
+        each batch of measurements, e.g. apply_measurements. Returns None when
+        no endpoint is set.
+        """
+        port = port if port is not None else self.config.get('Presetter Port')
+        socket_path = socket_path or self.config.get('Presetter Socket')
+        drop_folder = drop_folder or self.config.get('Presetter Folder')
+        if port is None and not socket_path and not drop_folder:
+            return None
+        machine_directory = self.config_path.parent
+        return ToolPresetter.PresetterService(
+            self.nominal_diameter, apply, self.config.get('Presetter Host') or ToolPresetter.DEFAULT_HOST, port,
+            machine_directory / socket_path if socket_path else None,
+            machine_directory / drop_folder if drop_folder else None)
+
+    def export(self, selected_rows, export_path=None):
+        """Write tool.tbl for `selected_rows` and save the tool order.
+
+        Returns the path and whether it was written; an unchanged table is left
+        alone so LinuxCNC doesn't reload it.
+        """
+        export_path = Path(export_path) if export_path else self.tool_table_path
+        with ToolTrace.span("export", rows=len(selected_rows)) as span:
+            export_data = build_export(self.config, self.csv_data, [tuple(row)[:5] for row in selected_rows],
+                                       self.columns)
+            written = ToolTable.write_tool_table(export_path, export_data)
+            self.save_order()
+            span["entries"], span["written"] = len(export_data), written
+        return export_path, written
+
+
+def report_interference(config_path, interference):
+    """Warn on stderr about colliding neighbours and oversized tools."""
+    if interference is None:
+        return
+    for first, second in interference.pairs:
+        print(f"{config_path}: warning: the tools in pockets {first} and {second} would collide", file=sys.stderr)
+    if interference.oversized:
+        print(f"{config_path}: warning: oversized tools (keep their neighbouring pockets small or empty): "
+              f"{' '.join(interference.oversized)}", file=sys.stderr)
+
+
+def serve_presetter(engine, port=None, socket_path=None, drop_folder=None):
+    def apply(measurements):
+        changed = engine.apply_measurements(measurements)
+        print(f"{engine.config_path}: stored {len(measurements)} measurements, {len(changed)} tools changed")
+
+    service = engine.presetter(apply, port, socket_path, drop_folder)
+    if service is None:
+        print(f"{engine.config_path}: give --port, --socket or --folder, or set Presetter Port, Presetter Socket "
+              f"or Presetter Folder in the config", file=sys.stderr)
+        return 2
+    try:
+        service.start()
+    except OSError as error:
+        print(f"{engine.config_path}: could not start the presetter service: {error}", file=sys.stderr)
+        return 1
+    endpoints = [f"{service.host}:{port}" for port in service.ports]
+    endpoints += [str(path) for path in (service.socket_path, service.drop_folder) if path]
+    print(f"{engine.config_path}: waiting for measurements on {', '.join(endpoints)} (Ctrl+C to stop)")
+    try:
+        service.thread.join()
+    except KeyboardInterrupt:
+        service.stop()
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="ToolLoader.py", description="Headless ToolLoader commands.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_machine_arguments(subparser):
+        subparser.add_argument("--config", action="append", type=Path,
+                               help="ToolLoader.config of a machine; repeat to process several machines")
+        subparser.add_argument("--library", type=Path, help="library.csv (default: next to each config)")
+        subparser.add_argument("--tool-table", type=Path, help="tool.tbl to merge Z offsets from (default: next to each config)")
+        subparser.add_argument("--state", type=Path, help="saved layout state (default: the config's name with .state, next to it)")
+
+    export_parser = subparsers.add_parser("export", help="write tool.tbl without starting the GUI")
+    add_machine_arguments(export_parser)
+    selection = export_parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--all", action="store_true", help="export every carousel pocket, like Export All")
+    selection.add_argument("--tools", help="comma separated tool numbers to export from the carousel, like Export Selection")
+    export_parser.add_argument("--output", type=Path, help="tool.tbl to write (default: the merged tool.tbl)")
+
+    presetter_parser = subparsers.add_parser("presetter", help="store tool measurements sent by a presetter")
+    add_machine_arguments(presetter_parser)
+    presetter_parser.add_argument("--port", type=int, help="TCP port to listen on (default: Presetter Port in the config)")
+    presetter_parser.add_argument("--socket", type=Path, help="Unix socket to listen on (default: Presetter Socket)")
+    presetter_parser.add_argument("--folder", type=Path, help="folder to take dropped CSV files from (default: Presetter Folder)")
+
+    list_parser = subparsers.add_parser("list", help="print the pocket layout")
+    add_machine_arguments(list_parser)
+
+    optimize_parser = subparsers.add_parser("optimize", help="assign pockets from the tool changes in NC programs")
+    add_machine_arguments(optimize_parser)
+    optimize_parser.add_argument("programs", nargs='+', type=Path, help="NC programs to scan for T/M6")
+    optimize_parser.add_argument("--batch", action="store_true",
+                                 help="treat the programs as jobs run in this order and minimize tool swaps between them")
+    optimize_parser.add_argument("--apply", action="store_true", help="save the (first job's) layout as the tool order")
+    optimize_parser.add_argument("--workers", type=int, help="processes used to scan programs (default: one per core)")
+
+    args = parser.parse_args(argv)
+    config_paths = args.config or [SCRIPT_DIRECTORY / "ToolLoader.config"]
+    if args.command == "export" and args.output and len(config_paths) > 1:
+        parser.error("--output can only be used with a single --config")
+    if args.command == "presetter":
+        if len(config_paths) > 1:
+            parser.error("presetter serves a single --config")
+        return serve_presetter(ToolEngine(config_paths[0], args.library, args.tool_table, args.state).load(),
+                               args.port, args.socket and args.socket.absolute(),
+                               args.folder and args.folder.absolute())
+
+    status = 0
+    for config_path in config_paths:
+        engine = ToolEngine(config_path, args.library, args.tool_table, args.state).load()
+        if args.command == "list":
+            writer = csv.writer(sys.stdout)
+            for row in engine.rows:
+                writer.writerow(row)
+            report_interference(config_path, engine.interference())
+            continue
+
+        if args.command == "optimize":
+            plans = engine.optimize(args.programs, args.batch, args.workers)
+            for plan in plans:
+                print(f"{plan.program}:")
+                if args.batch:
+                    print(f"  load: {' '.join(sorted(plan.load, key=int)) or '-'}")
+                    print(f"  unload: {' '.join(sorted(plan.unload, key=int)) or '-'}")
+                for tool_number, pocket in sorted(plan.pockets.items(), key=lambda item: item[1]):
+                    print(f"  pocket {pocket}: T{tool_number}")
+                if plan.manual:
+                    print(f"  manual: {' '.join(plan.manual)}")
+            if args.apply:
+                engine.apply_plan(plans[0])
+                print(f"{config_path}: saved the layout for {plans[0].program} to {engine.state_path}")
+            continue
+
+        if args.all:
+            selected_rows = engine.carousel_rows()
+        else:
+            wanted = {tool.strip().upper().removeprefix('T') for tool in args.tools.split(',') if tool.strip()}
+            selected_rows = [row for row in engine.carousel_rows() if row.tool_number in wanted]
+            # Rack tools have no pocket to export them to
+            missing = wanted - {row.tool_number for row in selected_rows}
+            if missing:
+                print(f"{config_path}: not in the carousel: {' '.join(sorted(missing))}",
+                      file=sys.stderr)
+                status = 1
+                continue
+        report_interference(config_path, engine.interference(selected_rows))
+        export_path, written = engine.export(selected_rows, args.output)
+        if written:
+            exported = sum(1 for row in selected_rows if row.tool_number in engine.csv_data)
+            print(f"{config_path}: exported {exported} tools to {export_path}")
+        else:
+            print(f"{config_path}: {export_path} is already up to date")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(ToolTrace.configure(sys.argv[1:])))
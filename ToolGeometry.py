@@ -0,0 +1,153 @@
+"""Radial envelopes of tool assemblies and interference between neighbouring pockets.
+
+A tool hangs in its pocket by the holder, so every outline is measured down
+the tool axis from the holder's gauge line: the holder segments stack up from
+the holder's nose, and below the nose come the shank, the shaft segments and
+the cutter down to the tip. Outlines come from library.csv's
+holder_segments/shaft_segments ("H0.144 U1.875 L1.275; ..." is a segment
+0.144 high, 1.875 across at the top and 1.275 at the bottom) and gauge lengths.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import ToolUnits
+
+# Envelope resolution along the tool axis, in the machine's unit
+STEP = {ToolUnits.MILLIMETERS: 0.5, ToolUnits.INCHES: 0.02}
+
+# Pockets (first, second) whose tools collide, and the tools wider than half the pocket spacing
+Interference = namedtuple("Interference", "pairs oversized")
+
+
+def parse_segments(text):
+    """[(height, upper diameter, lower diameter), ...] of a segment string, lowest segment first."""
+    segments = []
+    for part in text.split(';'):
+        values = {token[:1].upper(): token[1:] for token in part.split()}
+        try:
+            segments.append((float(values['H']), float(values['U']), float(values['L'])))
+        except (KeyError, ValueError):
+            continue  # Blank or malformed segment
+    return segments
+
+
+def outline(tool):
+    """(top, bottom, radius) spans of a tool assembly in the tool's unit, measured down from the gauge line."""
+    holder = parse_segments(tool.holder_segments)
+    holder_bottom = tool.holder_gauge_length
+    if holder_bottom is None:
+        holder_bottom = sum(height for height, _, _ in holder)
+    spans = []
+    bottom = holder_bottom
+    for height, upper, lower in holder:
+        spans.append((bottom - height, bottom, max(upper, lower) / 2))
+        bottom -= height
+
+    if tool.assembly_gauge_length is not None and tool.assembly_gauge_length > holder_bottom:
+        tip = tool.assembly_gauge_length
+    else:
+        tip = holder_bottom + (tool.body_length or tool.overall_length or tool.flute_length or 0)
+    diameter = tool.diameter or 0
+    top = max(tip - tool.flute_length, holder_bottom) if tool.flute_length else holder_bottom
+    spans.append((top, tip, diameter / 2))
+    # Shaft segments climb from the top of the flutes; plain shank fills any gap up to the holder
+    for height, upper, lower in parse_segments(tool.shaft_segments):
+        if top <= holder_bottom:
+            break
+        spans.append((max(top - height, holder_bottom), top, max(upper, lower) / 2))
+        top -= height
+    if top > holder_bottom:
+        spans.append((holder_bottom, top, (tool.shaft_diameter or diameter) / 2))
+    return spans
+
+
+def pocket_distance(pocket_pitch, carousel_radius=None):
+    """Distance between the axes of neighbouring pockets, `pocket_pitch` apart along the pitch circle."""
+    if not carousel_radius:
+        return pocket_pitch
+    return 2 * carousel_radius * math.sin(min(pocket_pitch / (2 * carousel_radius), math.pi / 2))
+
+
+class ToolEnvelopes:
+    """Radius of each tool assembly along its axis, in the machine's unit.
+
+    A tool's profile is built from its outline the first time it is asked
+    for and kept: the largest radius within every STEP from the gauge line
+    down (steps above the gauge line count negative), so a check on the
+    profiles errs towards reporting a clash. forget() drops a tool whose
+    library entry changed.
+    """
+
+    def __init__(self, tools=None, machine_unit=ToolUnits.MILLIMETERS):
+        self.tools = tools or {}
+        self.unit = machine_unit
+        self.step = STEP[machine_unit]
+        self.profiles = {}  # Tool number -> (first step, radii)
+
+    def profile(self, tool_number):
+        profile = self.profiles.get(tool_number)
+        if profile is None:
+            profile = self.profiles[tool_number] = self.build(self.tools[tool_number])
+        return profile
+
+    def forget(self, tool_number):
+        self.profiles.pop(tool_number, None)
+
+    def build(self, tool):
+        spans = np.array(outline(tool), dtype=float).reshape(-1, 3)
+        unit = ToolUnits.unit_of(tool.unit, self.unit)
+        spans *= ToolUnits.convert(1.0, unit, self.unit)
+        # Rounding slack, so a holder whose segments add up to its gauge length doesn't poke above it
+        tops = np.floor(spans[:, 0] / self.step + 1e-6).astype(int)
+        bottoms = np.ceil(spans[:, 1] / self.step - 1e-6).astype(int)
+        if not len(spans) or bottoms.max() <= tops.min():
+            return 0, np.zeros(0)
+        first = tops.min()
+        radii = np.zeros(bottoms.max() - first, dtype=np.float32)
+        for top, bottom, radius in zip(tops - first, bottoms - first, spans[:, 2]):
+            np.maximum(radii[top:bottom], radius, out=radii[top:bottom])
+        return int(first), radii
+
+    def envelope(self, pocket_tools):
+        """Radii of the tools in `pocket_tools` ("" for an empty pocket) on one grid, a row per pocket."""
+        profiles = [self.profile(tool_number) if tool_number else None for tool_number in pocket_tools]
+        placed = [profile for profile in profiles if profile is not None and len(profile[1])]
+        if not placed:
+            return np.zeros((len(pocket_tools), 0))
+        first = min(start for start, _ in placed)
+        last = max(start + len(radii) for start, radii in placed)
+        envelope = np.zeros((len(pocket_tools), last - first), dtype=np.float32)
+        for row, profile in enumerate(profiles):
+            if profile is not None:
+                start, radii = profile
+                envelope[row, start - first:start - first + len(radii)] = radii
+        return envelope
+
+    def check(self, pocket_tools, distance):
+        """Find the neighbouring tools of a carousel that would touch.
+
+        `pocket_tools` holds the tool number in each pocket from pocket 1 on,
+        "" where it is empty, and the last pocket neighbours the first.
+        `distance` is the spacing of the pocket axes. Returns an Interference:
+        the (pocket, next pocket) pairs whose tools overlap at some height,
+        and the tools wider than half the spacing, which only fit beside
+        small tools or empty pockets.
+        """
+        envelope = self.envelope(pocket_tools)
+        pockets = len(pocket_tools)
+        if not envelope.size:
+            return Interference([], [])
+        widest = envelope.max(axis=1)
+        oversized = [pocket_tools[row] for row in np.flatnonzero(widest > distance / 2)]
+        if pockets < 2:
+            return Interference([], oversized)
+        # Each pocket against the next; the last against the first unless that is the same pair again
+        clash = np.zeros(pockets, dtype=bool)
+        clash[:-1] = (envelope[:-1] + envelope[1:] > distance).any(axis=1)
+        clash[-1] = pockets > 2 and (envelope[-1] + envelope[0] > distance).any()
+        occupied = np.array([tool_number != '' for tool_number in pocket_tools])
+        clash &= occupied & np.roll(occupied, -1)
+        pairs = [(int(row) + 1, (int(row) + 1) % pockets + 1) for row in np.flatnonzero(clash)]
+        return Interference(pairs, oversized)
@@ -0,0 +1,130 @@
+import itertools
+import os
+import queue
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+import ToolTrace
+
+DEFAULT_IMAGE = "No_Image_Available.jpg"
+THUMBNAIL_DIRECTORY = ".thumbnails"
+
+# Request priorities: the selected row is decoded before its prefetched neighbours
+SELECTED = 0
+PREFETCH = 1
+
+
+class ThumbnailCache:
+    """Bounded LRU of decoded tool thumbnails, filled by a background thread.
+
+    Thumbnails are PIL images, so the worker never touches Tk; the GUI turns
+    them into PhotoImages on the main thread. Entries are keyed by image file,
+    so every tool without a photo shares one decoded "No Image" thumbnail.
+    Decoded thumbnails are also written to ToolImages/.thumbnails and reused
+    until the original photo changes.
+    """
+
+    def __init__(self, image_directory, size=(280, 280), max_entries=64):
+        self.image_directory = Path(image_directory)
+        self.thumbnail_directory = self.image_directory / THUMBNAIL_DIRECTORY
+        self.size = size
+        self.max_entries = max_entries
+
+        self.lock = threading.Lock()
+        self.images = OrderedDict()  # Image path -> thumbnail, or None if it can't be read
+        self.pending = set()
+        self.requests = queue.PriorityQueue()
+        self.sequence = itertools.count()  # Keeps equal priorities first-in, first-out
+        self.worker = threading.Thread(target=self.run, name="ThumbnailCache", daemon=True)
+        self.worker.start()
+
+    def image_path(self, tool_number):
+        image_path = self.image_directory / f"{tool_number}.jpg"
+        if not image_path.exists():
+            # If the specific tool image does not exist, use the default image
+            image_path = self.image_directory / DEFAULT_IMAGE
+        return image_path
+
+    def cached(self, tool_number):
+        image_path = self.image_path(tool_number)
+        with self.lock:
+            return image_path in self.images
+
+    def get(self, tool_number):
+        """Return the cached thumbnail for a tool, or None if it isn't decoded (or has no image)."""
+        image_path = self.image_path(tool_number)
+        with self.lock:
+            if image_path not in self.images:
+                return None
+            self.images.move_to_end(image_path)
+            return self.images[image_path]
+
+    def request(self, tool_number, priority=SELECTED):
+        """Queue a tool's thumbnail for decoding unless it is cached or already queued."""
+        image_path = self.image_path(tool_number)
+        with self.lock:
+            if image_path in self.images or image_path in self.pending:
+                return
+            self.pending.add(image_path)
+        self.requests.put((priority, next(self.sequence), image_path))
+
+    def busy(self):
+        with self.lock:
+            return bool(self.pending)
+
+    def run(self):
+        while True:
+            _, _, image_path = self.requests.get()
+            image = self.load(image_path)
+            with self.lock:
+                self.pending.discard(image_path)
+                self.images[image_path] = image
+                self.images.move_to_end(image_path)
+                while len(self.images) > self.max_entries:
+                    self.images.popitem(last=False)
+
+    def load(self, image_path):
+        """Decode a thumbnail, preferring the on-disk copy when it is newer than the photo."""
+        with ToolTrace.span("thumbnail", image=image_path.name) as span:
+            thumbnail, span["source"] = self.decode(image_path)
+        return thumbnail
+
+    def decode(self, image_path):
+        """Return the thumbnail and where it came from: "missing", "disk" or "photo"."""
+        if not image_path.exists():
+            return None, "missing"
+        thumbnail_path = self.thumbnail_directory / image_path.name
+        try:
+            if thumbnail_path.stat().st_mtime_ns >= image_path.stat().st_mtime_ns:
+                with Image.open(thumbnail_path) as thumbnail:
+                    thumbnail.load()
+                    return thumbnail.copy(), "disk"
+        except OSError:
+            pass  # Missing or unreadable thumbnail, decode the original
+
+        try:
+            with Image.open(image_path) as image:
+                # Let the JPEG decoder downscale while decoding instead of expanding every pixel
+                image.draft('RGB', self.size)
+                image.thumbnail(self.size)
+                thumbnail = image.convert('RGB')
+        except OSError:
+            return None, "missing"
+        self.save(thumbnail, thumbnail_path)
+        return thumbnail, "photo"
+
+    def save(self, thumbnail, thumbnail_path):
+        temp_path = thumbnail_path.with_name(thumbnail_path.name + ".tmp")
+        try:
+            self.thumbnail_directory.mkdir(exist_ok=True)
+            thumbnail.save(temp_path, "JPEG", quality=90)
+            os.replace(temp_path, thumbnail_path)
+        except OSError:
+            # A read-only image folder just means thumbnails are decoded every run
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
@@ -0,0 +1,111 @@
+from bisect import bisect_left
+from collections import namedtuple
+
+# A block move: `runs` are the (slot, count) stretches the block was taken from,
+# `destination` the slot its first tool lands in once the others have shifted
+Move = namedtuple("Move", "runs destination")
+# Layout rows a move touched, and the rows the moved tools are in afterwards
+Change = namedtuple("Change", "changed moved")
+
+
+def runs_of(slots):
+    """Collapse slot indices into sorted (start, count) stretches."""
+    runs = []
+    for slot in sorted(set(slots)):
+        if runs and runs[-1][0] + runs[-1][1] == slot:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((slot, 1))
+    return tuple(runs)
+
+
+def apply_move(tools, move):
+    """Carry out `move` on the list `tools` in place."""
+    block = []
+    # Later stretches first, so earlier slot indices stay valid
+    for start, count in reversed(move.runs):
+        block[:0] = tools[start:start + count]
+        del tools[start:start + count]
+    tools[move.destination:move.destination] = block
+
+
+def revert_move(tools, move):
+    """Undo `move` on the list `tools` in place."""
+    count = sum(run_count for _, run_count in move.runs)
+    block = tools[move.destination:move.destination + count]
+    del tools[move.destination:move.destination + count]
+    offset = 0
+    for start, run_count in move.runs:
+        tools[start:start] = block[offset:offset + run_count]
+        offset += run_count
+
+
+class PocketLayout:
+    """The order of the tools in a layout's movable rows, with undo and redo.
+
+    Every row except a disabled pocket is a slot. Moving a block of tools
+    inserts it at the drop target and shifts the tools in between by one slot
+    each, so they jump over disabled pockets and those never change. Moves
+    are journaled as a Move, whose size depends on how many separate
+    stretches were selected and not on the size of the layout, so the whole
+    session can be undone.
+    """
+
+    def __init__(self, rows=()):
+        self.slot_rows = [position for position, row in enumerate(rows) if row.tag != 'disabled']
+        self.row_slots = {position: slot for slot, position in enumerate(self.slot_rows)}
+        self.tools = [rows[position].tool_number for position in self.slot_rows]
+        self.journal = []
+        self.applied = 0  # Moves of the journal in effect; the ones after it can be redone
+
+    def tool_at(self, position):
+        return self.tools[self.row_slots[position]]
+
+    def slot_at(self, position):
+        """The slot a drop on row `position` lands in; a disabled row gives the slot after it."""
+        return min(bisect_left(self.slot_rows, position), len(self.slot_rows) - 1)
+
+    def move(self, positions, target):
+        """Move the tools in rows `positions` as a block so the first lands on row `target`.
+
+        Returns a Change, or None when nothing moved.
+        """
+        slots = [self.row_slots[position] for position in positions if position in self.row_slots]
+        if not slots:
+            return None
+        runs = runs_of(slots)
+        count = len(set(slots))
+        move = Move(runs, min(self.slot_at(target), len(self.tools) - count))
+        if runs == ((move.destination, count),):
+            return None  # Already there
+        del self.journal[self.applied:]
+        self.journal.append(move)
+        self.applied += 1
+        return self.apply(move)
+
+    def undo(self):
+        if not self.applied:
+            return None
+        self.applied -= 1
+        return self.revert(self.journal[self.applied])
+
+    def redo(self):
+        if self.applied == len(self.journal):
+            return None
+        self.applied += 1
+        return self.apply(self.journal[self.applied - 1])
+
+    def apply(self, move):
+        apply_move(self.tools, move)
+        count = sum(run_count for _, run_count in move.runs)
+        return self.change(move, range(move.destination, move.destination + count))
+
+    def revert(self, move):
+        revert_move(self.tools, move)
+        return self.change(move, [slot for start, run_count in move.runs for slot in range(start, start + run_count)])
+
+    def change(self, move, moved_slots):
+        count = sum(run_count for _, run_count in move.runs)
+        first = min(move.runs[0][0], move.destination)
+        last = max(move.runs[-1][0] + move.runs[-1][1], move.destination + count)
+        return Change(self.slot_rows[first:last], [self.slot_rows[slot] for slot in moved_slots])
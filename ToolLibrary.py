@@ -0,0 +1,351 @@
+import csv
+import math
+import os
+import pickle
+import re
+import shutil
+import sys
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+import ToolTrace
+
+# Fusion 360 library.csv headers ToolLoader reads; every other column is skipped while parsing
+NUMBER_COLUMN = "Number (tool_number)"
+TOOL_INDEX_COLUMN = "Tool Index (tool_index)"
+DESCRIPTION_COLUMN = "Description (tool_description)"
+DIAMETER_COLUMN = "Diameter (tool_diameter)"
+UNIT_COLUMN = "Unit (tool_unit)"
+COMMENT_COLUMN = "Comment (tool_comment)"
+TYPE_COLUMN = "Type (tool_type)"
+VENDOR_COLUMN = "Vendor (tool_vendor)"
+MATERIAL_COLUMN = "Material (tool_material)"
+OVERALL_LENGTH_COLUMN = "Overall Length (tool_overallLength)"
+FLUTE_LENGTH_COLUMN = "Flute Length (tool_fluteLength)"
+CORNER_RADIUS_COLUMN = "Corner Radius (tool_cornerRadius)"
+FLUTES_COLUMN = "Number of Flutes (tool_numberOfFlutes)"
+PRESET_NAME_COLUMN = "Preset Name (preset_name)"
+HOLDER_SEGMENTS_COLUMN = "Holder Segments (holder_segments)"
+SHAFT_SEGMENTS_COLUMN = "Shaft Segments (shaft_segments)"
+
+# ToolRecord attribute filled from each column
+TEXT_FIELDS = {"description": DESCRIPTION_COLUMN, "unit": UNIT_COLUMN, "comment": COMMENT_COLUMN,
+               "type": TYPE_COLUMN, "vendor": VENDOR_COLUMN, "material": MATERIAL_COLUMN}
+NUMBER_FIELDS = {"diameter": DIAMETER_COLUMN, "overall_length": OVERALL_LENGTH_COLUMN,
+                 "flute_length": FLUTE_LENGTH_COLUMN, "corner_radius": CORNER_RADIUS_COLUMN, "flute_count": FLUTES_COLUMN,
+                 "shaft_diameter": "Shaft Diameter (tool_shaftDiameter)", "body_length": "Body Length (tool_bodyLength)",
+                 "holder_gauge_length": "Gauge Length (tool_holderGaugeLength)",
+                 "assembly_gauge_length": "Gauge Length (tool_assemblyGaugeLength)"}
+# Holder and shaft outlines ("H0.144 U1.875 L1.275; ..."), read by ToolGeometry
+SEGMENT_FIELDS = {"holder_segments": HOLDER_SEGMENTS_COLUMN, "shaft_segments": SHAFT_SEGMENTS_COLUMN}
+# Columns that differ between the preset rows of one tool
+PRESET_FIELDS = {"spindle_speed": "Spindle Speed (tool_spindleSpeed)",
+                 "cutting_feed": "Cutting Feedrate (tool_feedCutting)",
+                 "plunge_feed": "Plunge Feedrate (tool_feedPlunge)",
+                 "feed_per_tooth": "Feed per Tooth (tool_feedPerTooth)"}
+
+Preset = namedtuple("Preset", ("name",) + tuple(PRESET_FIELDS))
+
+# One field of a raw CSV record: quoted (may contain commas, "" and newlines) or bare
+CSV_FIELD = re.compile(r'"(?:[^"]|"")*"|[^,\r\n"]*')
+
+# Bump whenever the parsed fields or the cached layout change so stale caches get re-parsed
+CACHE_VERSION = 5
+
+
+def to_number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def format_number(value):
+    """Shortest text for a parsed number: 0.25 -> "0.25", 12.0 -> "12", None -> ""."""
+    if value is None:
+        return ''
+    text = repr(value)
+    return text[:-2] if text.endswith('.0') else text
+
+
+class ToolRecord:
+    """One tool of library.csv: the fields ToolLoader uses, with numbers parsed, and its presets.
+
+    Fusion repeats the tool's own columns on every preset row, so they are
+    taken from the tool's first row. The preset name, speed and feeds of
+    every row are kept in `preset_names` and the flat `preset_values` array
+    (len(PRESET_FIELDS) values per preset, NaN where blank). The other
+    columns of library.csv are not kept at all.
+    """
+
+    __slots__ = ("number", "description", "diameter", "unit", "comment", "type", "vendor", "material",
+                 "overall_length", "flute_length", "corner_radius", "flute_count", "shaft_diameter", "body_length",
+                 "holder_gauge_length", "assembly_gauge_length", "holder_segments", "shaft_segments",
+                 "preset_names", "preset_values")
+
+    def __init__(self, number, description='', diameter=None, unit='', comment='', type='', vendor='',
+                 material='', overall_length=None, flute_length=None, corner_radius=None, flute_count=None,
+                 shaft_diameter=None, body_length=None, holder_gauge_length=None, assembly_gauge_length=None,
+                 holder_segments='', shaft_segments=''):
+        self.number = number
+        self.description = description
+        self.diameter = diameter
+        self.unit = unit
+        self.comment = comment
+        self.type = type
+        self.vendor = vendor
+        self.material = material
+        self.overall_length = overall_length
+        self.flute_length = flute_length
+        self.corner_radius = corner_radius
+        self.flute_count = flute_count
+        self.shaft_diameter = shaft_diameter
+        self.body_length = body_length
+        self.holder_gauge_length = holder_gauge_length
+        self.assembly_gauge_length = assembly_gauge_length
+        self.holder_segments = holder_segments
+        self.shaft_segments = shaft_segments
+        self.preset_names = []
+        self.preset_values = array('d')
+
+    @property
+    def diameter_text(self):
+        return format_number(self.diameter)
+
+    def add_preset(self, name, values):
+        self.preset_names.append(name)
+        self.preset_values.extend(values)
+
+    @property
+    def presets(self):
+        width = len(PRESET_FIELDS)
+        return [Preset(name, *(None if math.isnan(value) else value
+                               for value in self.preset_values[index * width:(index + 1) * width]))
+                for index, name in enumerate(self.preset_names)]
+
+    def preset(self, name):
+        for preset in self.presets:
+            if preset.name == name:
+                return preset
+        return None
+
+    # Pickle as a plain tuple: smaller and faster to load than the default for __slots__ classes
+    def __getstate__(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        for field, value in zip(self.__slots__, state):
+            setattr(self, field, value)
+
+    def __repr__(self):
+        return f"ToolRecord({self.number!r}, {self.description!r}, {len(self.preset_names)} presets)"
+
+
+def cache_path_for(library_path):
+    return library_path.with_name(library_path.name + ".cache")
+
+
+def parse_library(library_path):
+    """Stream library.csv into a ToolRecord per tool number, with every preset row kept.
+
+    Returns {tool number: ToolRecord} sorted by tool number. Rows of one tool
+    share its Tool Index; when several tools have the same number, the last
+    one wins.
+    """
+    tools = {}
+    with open(library_path, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        headers = next(reader, None)
+        if not headers:
+            return {}
+        column_index = {name: index for index, name in enumerate(headers)}
+        number_index = column_index[NUMBER_COLUMN]
+        tool_index_index = column_index.get(TOOL_INDEX_COLUMN)
+        tool_indexes = {}  # Tool number -> Tool Index of the tool that has it
+        text_fields = [(field, column_index[column]) for field, column in TEXT_FIELDS.items() if column in column_index]
+        number_fields = [(field, column_index[column]) for field, column in NUMBER_FIELDS.items()
+                         if column in column_index]
+        segment_fields = [(field, column_index[column]) for field, column in SEGMENT_FIELDS.items()
+                          if column in column_index]
+        preset_name_index = column_index.get(PRESET_NAME_COLUMN)
+        preset_indexes = [column_index.get(column) for column in PRESET_FIELDS.values()]
+        for row in reader:
+            row_length = len(row)
+            if row_length <= number_index:
+                continue  # Blank or truncated line
+
+            def field(index):
+                return row[index] if index is not None and index < row_length else ''
+
+            tool_number = int(row[number_index])
+            tool = tools.get(tool_number)
+            tool_index = field(tool_index_index)
+            if tool is None or tool_indexes[tool_number] != tool_index:
+                tool = tools[tool_number] = ToolRecord(str(tool_number))
+                tool_indexes[tool_number] = tool_index
+                for name, index in text_fields:
+                    setattr(tool, name, field(index))
+                for name, index in number_fields:
+                    setattr(tool, name, to_number(field(index)))
+                for name, index in segment_fields:
+                    # Many tools sit in the same holder, so share one string per outline
+                    setattr(tool, name, sys.intern(field(index)))
+                if tool.flute_count is not None:
+                    tool.flute_count = int(tool.flute_count)
+            values = (to_number(field(index)) for index in preset_indexes)
+            # Libraries reuse a handful of preset names, so share one string per name
+            tool.add_preset(sys.intern(field(preset_name_index)),
+                            [math.nan if value is None else value for value in values])
+    return {str(tool_number): tools[tool_number] for tool_number in sorted(tools)}
+
+
+def read_cache(cache_path, stat):
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if (cached.get('version') != CACHE_VERSION or cached.get('mtime_ns') != stat.st_mtime_ns
+            or cached.get('size') != stat.st_size):
+        return None
+    return cached['tools']
+
+
+def write_cache(cache_path, stat, tools):
+    temp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(temp_path, 'wb') as cache_file:
+            pickle.dump({'version': CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size,
+                         'tools': tools}, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        # A read-only library folder just means no cache
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+
+
+def load_library(library_path, use_cache=True):
+    """Load library.csv, reusing the parsed cache beside it while the file is unchanged."""
+    library_path = Path(library_path)
+    if not library_path.exists():
+        return {}
+    stat = library_path.stat()
+    cache_path = cache_path_for(library_path)
+    if use_cache:
+        with ToolTrace.span("read_library_cache") as span:
+            tools = read_cache(cache_path, stat)
+            span["hit"] = tools is not None
+        if tools is not None:
+            return tools
+    with ToolTrace.span("parse_library", size=stat.st_size) as span:
+        tools = parse_library(library_path)
+        span["tools"] = len(tools)
+    if use_cache:
+        write_cache(cache_path, stat, tools)
+    return tools
+
+
+def replace_field(record, field_index, value):
+    """Return the raw CSV `record` with field `field_index` replaced by a quoted `value`.
+
+    Only the fields up to the one replaced are scanned; the rest of the record
+    is copied as is.
+    """
+    position = 0
+    for _ in range(field_index):
+        position = CSV_FIELD.match(record, position).end() + 1  # Step over the comma
+    end = CSV_FIELD.match(record, position).end()
+    return record[:position] + '"' + value.replace('"', '""') + '"' + record[end:]
+
+
+def rewrite_fields(library_path, values):
+    """Set fields on every preset row of the tools in `values` in one pass.
+
+    `values` maps tool numbers to {column name: text}, e.g.
+    {"5": {COMMENT_COLUMN: "42.1"}}.
+    Untouched rows are copied byte for byte. The new file is written next to
+    library.csv and renamed over it, so a crash leaves either the old or the
+    new library, never a partial one.
+    """
+    temp_path = library_path.with_name(library_path.name + ".tmp")
+    raw_lines = []
+
+    def record_lines(csv_file):
+        for line in csv_file:
+            raw_lines.append(line)
+            yield line
+
+    try:
+        with open(library_path, newline='') as csv_file, open(temp_path, 'w', newline='') as temp_file:
+            reader = csv.reader(record_lines(csv_file))
+            headers = next(reader)
+            temp_file.write(''.join(raw_lines))
+            raw_lines.clear()
+            number_index = headers.index(NUMBER_COLUMN)
+            tool_fields = {tool_number: [(headers.index(column), text) for column, text in columns.items()]
+                           for tool_number, columns in values.items()}
+            for row in reader:
+                record = ''.join(raw_lines)
+                raw_lines.clear()
+                if len(row) > number_index and row[number_index].strip():
+                    for field_index, text in tool_fields.get(str(int(row[number_index])), ()):
+                        if field_index < len(row) and row[field_index] != text:
+                            record = replace_field(record, field_index, text)
+                temp_file.write(record)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        shutil.copymode(library_path, temp_path)
+        os.replace(temp_path, library_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+def update_tools(library_path, updates, tools):
+    """Write new field values for several tools to library.csv in one rewrite, if any differ.
+
+    `updates` maps tool numbers to {ToolRecord attribute: text}; only the
+    text and number fields read from library.csv can be set. The records in
+    `tools` are updated to match. Returns the {tool number: {attribute: text}}
+    values that changed.
+    """
+    columns = dict(TEXT_FIELDS, **NUMBER_FIELDS)
+    changed = {}
+    for tool_number, values in updates.items():
+        tool = tools.get(tool_number)
+        if tool is None:
+            continue
+        differs = {field: text for field, text in values.items()
+                   if (text if field in TEXT_FIELDS else to_number(text)) != getattr(tool, field)}
+        if differs:
+            changed[tool_number] = differs
+    if not changed:
+        return changed
+
+    with ToolTrace.span("rewrite_library", tools=len(changed)):
+        rewrite_fields(library_path, {tool_number: {columns[field]: text for field, text in values.items()}
+                                      for tool_number, values in changed.items()})
+    for tool_number, values in changed.items():
+        for field, text in values.items():
+            setattr(tools[tool_number], field, text if field in TEXT_FIELDS else to_number(text))
+    # The rewrite only touched these fields, so refresh the cache instead of re-parsing next time
+    write_cache(cache_path_for(library_path), library_path.stat(), tools)
+    return changed
+
+
+def merge_z_offsets(library_path, z_values, tools=None):
+    """Store tool.tbl Z offsets in the library comments, writing only if one differs.
+
+    `z_values` maps tool numbers to Z offset strings; `tools` is the already
+    loaded library, if any. Returns the library (updated in place) and the
+    {tool number: Z offset} entries that changed.
+    """
+    library_path = Path(library_path)
+    if tools is None:
+        tools = load_library(library_path)
+    changed = update_tools(library_path, {tool_number: {"comment": z_value} for tool_number, z_value in z_values.items()},
+                           tools)
+    return tools, {tool_number: values["comment"] for tool_number, values in changed.items()}
@@ -1,428 +1,470 @@
-import tkinter as tk
-import re
-from tkinter import ttk
-from tkinter import messagebox
-import csv
-from PIL import Image, ImageTk
-from pathlib import Path
-
-def parse_config(config_path):
-        config = {}
-        with open(config_path, 'r') as file:
-            for line in file:
-                key, value = line.strip().split(': ')
-                config[key] = value
-        # Convert values to appropriate types
-        config['Total Pockets'] = int(config['Total Pockets'])
-        config['Disabled Pockets'] = [int(x) for x in config['Disabled Pockets'].split(',')] if config['Disabled Pockets'] else []
-        config['Tool Changer Range'] = tuple(int(x) for x in config['Tool Changer Range'].split('-'))
-        config['Manual Tool Range'] = tuple(int(x) for x in config['Manual Tool Range'].split('-'))
-        return config
-
-class ToolSelectorApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Tool Selector")
-        self.images_cache = {}  # Cache for Tkinter-compatible images to avoid reloading
-
-        # Update library.csv with any Z values from existing tool.tbl
-        self.update_library_with_z_values()
-
-        # Load the configuration here
-        config_path = Path(__file__).parent / "ToolLoader.config"
-        self.config = parse_config(config_path)
-
-        # Initialize max_selections based on the config
-        self.max_selections = self.config['Total Pockets'] - len(self.config['Disabled Pockets'])
-
-        self.csv_data = {}
-
-        self.load_csv(Path(__file__).parent / "library.csv")
-
-        # Setup Treeview on the left side
-        self.tree = ttk.Treeview(root, columns=("Carousel Pocket", "Tool Number", "Description", "Diameter", "Comment"), show="headings")
-        self.tree.heading("Carousel Pocket", text="Carousel Pocket")
-        self.tree.heading("Tool Number", text="Tool Number")
-        self.tree.heading("Description", text="Description")
-        self.tree.heading("Diameter", text="Diameter")
-        self.tree.heading("Comment", text="Z Offset")
-        self.tree.column("Carousel Pocket", width=100, anchor="center")
-        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Initialize variables
-        self.dragged_item = None
-        self.disabled_pockets = []  # Assuming this is populated from the config
-        
-        # Bind mouse events for drag-and-drop
-        self.tree.bind('<Button-1>', self.on_item_click)  # Could be adjusted for the specific behavior
-        self.tree.bind('<B1-Motion>', self.on_item_drag)
-        self.tree.bind('<ButtonRelease-1>', self.on_item_drop)
-
-        # Right side container for the export button and image display
-        self.right_side_container = tk.Frame(root, width=400)
-        self.right_side_container.pack(side=tk.RIGHT, fill=tk.BOTH, expand=False)
-
-        # Export button at the top of the right side
-        self.export_button = tk.Button(self.right_side_container, text="Export Selection", command=self.export_selection)
-        self.export_button.pack(pady=10)
-
-        # Add "Export All" button
-        self.export_all_button = tk.Button(self.right_side_container, text="Export All", command=self.export_all)
-        self.export_all_button.pack(pady=10)  # Adjust padding as needed
-
-        # Save tool order button
-        self.toolorder_button = tk.Button(self.right_side_container, text="Save Tool Order", command=self.save_current_order)
-        self.toolorder_button.pack(pady=10)
-
-        # Now, create and pack the image label inside the frame without padx/pady
-        self.image_label = tk.Label(self.right_side_container, width=400)
-        self.image_label.pack(fill=tk.BOTH, expand=True)
-
-        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
-
-        self.populate_tree()
-
-
-    def on_item_click(self, event):
-        """Initiate drag only for non-disabled items."""
-        item = self.tree.identify_row(event.y)
-        if item and 'disabled' not in self.tree.item(item, 'tags'):
-            self.dragged_item = item
-        else:
-            self.dragged_item = None  # Prevent dragging disabled items
-
-    def on_item_drag(self, event):
-        """Provide visual feedback during dragging or prevent dragging visually if needed."""
-        # This could be expanded with visual feedback, but is not essential for basic functionality
-
-
-    def on_item_drop(self, event):
-        """Reorder items without changing 'Carousel Pocket' numbers or moving disabled pockets."""
-        if not self.dragged_item:
-            return  # No item was being dragged
-
-        target_item = self.tree.identify_row(event.y)
-        if not target_item or 'disabled' in self.tree.item(target_item, 'tags'):
-            return  # Drop target is invalid or disabled
-
-        # Get the index positions for drag start and drop target
-        dragged_index = self.tree.index(self.dragged_item)
-        target_index = self.tree.index(target_item)
-
-        # Retrieve values for both items, ensuring they're treated as tuples
-        dragged_values = tuple(self.tree.item(self.dragged_item)['values'])
-        target_values = tuple(self.tree.item(target_item)['values'])
-
-        # Swap tool data, keeping the carousel pocket numbers fixed
-        if dragged_index < target_index:
-            # Moving down
-            self.tree.item(self.dragged_item, values=(dragged_values[0],) + target_values[1:])
-            self.tree.item(target_item, values=(target_values[0],) + dragged_values[1:])
-        else:
-            # Moving up
-            self.tree.item(self.dragged_item, values=(dragged_values[0],) + target_values[1:])
-            self.tree.item(target_item, values=(target_values[0],) + dragged_values[1:])
-
-        self.dragged_item = None  # Reset after drop
-
-
-    def load_csv(self, file_path):
-        if file_path.exists():
-            with open(file_path, newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                data = []
-                for row in reader:
-                    tool_number = int(row["Number (tool_number)"])  # Convert tool number to integer for sorting
-                    data.append((tool_number, row))
-                # Sort the list of tuples by the first element (tool number)
-                sorted_data = sorted(data, key=lambda x: x[0])
-                # Rebuild the csv_data dictionary with sorted entries
-                self.csv_data = {str(item[0]): item[1] for item in sorted_data}
-
-
-    def load_image(self, tool_number):
-        # Attempt to load the specific tool image
-        image_path = Path(__file__).parent / "ToolImages" / f"{tool_number}.jpg"
-        if not image_path.exists():
-            # If the specific tool image does not exist, load the default image
-            image_path = Path(__file__).parent / "ToolImages" / "No_Image_Available.jpg"
-        
-        # Load and display the image (specific tool image or default)
-        if image_path.exists():
-            image = Image.open(image_path)
-            image.thumbnail((280, 280))  # Resize image
-            photo = ImageTk.PhotoImage(image)
-            self.images_cache[tool_number] = photo  # Cache the image
-            return photo
-        else:
-            # If for some reason the default image is also missing, return None
-            return None
-
-    def display_image_for_tool(self, tool_number):
-        image = self.load_image(tool_number)  # Assuming this method returns a PhotoImage or None
-        if image:
-            self.image_label.config(image=image)
-            self.image_label.image = image  # Keep a reference
-        else:
-            self.image_label.config(image='')  # Clear the image if none is found
-            self.image_label.image = None
-
-    def populate_tree(self):
-        print("test")
-        tool_order = self.load_tool_order()
-        print("tested")
-        # Assuming self.config is already populated
-        total_pockets = self.config['Total Pockets']
-        disabled_pockets = self.config['Disabled Pockets']
-        tool_changer_range_start, tool_changer_range_end = self.config['Tool Changer Range']
-
-        pocket_number = 1
-        row_number = 1
-        inserted_tools = 0
-
-        # Prepare a list of tool numbers for insertion based on cached order
-        if tool_order:
-                tool_numbers_for_insertion = tool_order
-
-                # First pass: insert tools based on the cached or sorted order
-                for tool_number in tool_numbers_for_insertion:
-                    tool_info = self.csv_data.get(tool_number)
-                    if tool_info:
-                            tool_num = int(tool_number)
-                            if tool_changer_range_start <= tool_num <= tool_changer_range_end:
-                                while row_number in disabled_pockets:
-                                    self.tree.insert("", "end", values=(row_number, "503", "Pocket Disabled", "0", "0"), tags=('disabled',))
-                                    row_number += 1
-                                    pocket_number = row_number
-                                # Insert the tool with its pocket number
-                                if pocket_number != '':
-                                    self.tree.insert("", "end", values=(pocket_number, tool_number, tool_info["Description (tool_description)"],
-                                                    f"{tool_info['Diameter (tool_diameter)']} {tool_info['Unit (tool_unit)']}",
-                                                    tool_info.get("Comment (tool_comment)", "0")), tags=('carousel',))
-                                else:
-                                    self.tree.insert("", "end", values=(pocket_number, tool_number, tool_info["Description (tool_description)"],
-                                                    f"{tool_info['Diameter (tool_diameter)']} {tool_info['Unit (tool_unit)']}",
-                                                    tool_info.get("Comment (tool_comment)", "0")), tags=('rack',))
-                                if row_number < total_pockets:
-                                    row_number += 1
-                                    pocket_number = row_number
-                                else:
-                                    pocket_number = ''
-                                inserted_tools += 1
-
-                # Fill the remaining pockets with empty values if there are any left within the total pockets range
-                while row_number <= total_pockets:
-                    if row_number in disabled_pockets:
-                        self.tree.insert("", "end", values=(pocket_number, "503", "Pocket Disabled", "0", "0"), tags=('disabled',))
-                    else:
-                        self.tree.insert("", "end", values=(pocket_number, "", "", "", ""), tags=('empty',))
-                    row_number += 1
-                        
-
-        else:
-                # First, insert tools within the tool changer range, excluding disabled pockets
-                for tool_number, tool_info in sorted(self.csv_data.items(), key=lambda x: int(x[0])):
-                    tool_num = int(tool_number)
-                    if tool_changer_range_start <= tool_num <= tool_changer_range_end:
-                        while row_number in disabled_pockets:
-                            self.tree.insert("", "end", values=(row_number, "503", "Pocket Disabled", "0", "0"), tags=('disabled',))
-                            row_number += 1
-                            pocket_number = row_number
-                        # Insert the tool with its pocket number
-                        if pocket_number != '':
-                            self.tree.insert("", "end", values=(pocket_number, tool_number, tool_info["Description (tool_description)"],
-                                            f"{tool_info['Diameter (tool_diameter)']} {tool_info['Unit (tool_unit)']}",
-                                            tool_info.get("Comment (tool_comment)", "0")), tags=('carousel',))
-                        else:
-                            self.tree.insert("", "end", values=(pocket_number, tool_number, tool_info["Description (tool_description)"],
-                                            f"{tool_info['Diameter (tool_diameter)']} {tool_info['Unit (tool_unit)']}",
-                                            tool_info.get("Comment (tool_comment)", "0")), tags=('rack',))
-
-                        if row_number < total_pockets:
-                            row_number += 1
-                            pocket_number = row_number
-                        else:
-                            pocket_number = ''
-                        inserted_tools += 1
-
-                # Fill the remaining pockets with empty values if there are any left within the total pockets range
-                while row_number <= total_pockets:
-                    if row_number in disabled_pockets:
-                        self.tree.insert("", "end", values=(pocket_number, "503", "Pocket Disabled", "0", "0"), tags=('disabled',))
-                    else:
-                        self.tree.insert("", "end", values=(pocket_number, "", "", "", ""), tags=('empty',))
-                    row_number += 1
-
-        # Visually distinguish disabled pockets
-        self.tree.tag_configure('disabled', background='indianred')
-        # Optionally, configure empty pockets differently
-        self.tree.tag_configure('empty', background='white')
-        self.tree.tag_configure('carousel', background='skyblue')
-        self.tree.tag_configure('rack', background='gainsboro')
-
-    def save_current_order(self):
-        with open('ToolLoaderState.csv', 'w', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            for child in self.tree.get_children():
-                tool_number = self.tree.item(child, 'values')[1]  # Adjust index if necessary
-                writer.writerow([tool_number])
-
-    def load_tool_order(self):
-        cache_path = Path('ToolLoaderState.csv')
-        order = []
-        if cache_path.exists():
-            with open(cache_path, 'r') as csvfile:
-                reader = csv.reader(csvfile)
-                order = [row[0] for row in reader]
-        print(order)
-        for row in self.csv_data:
-            if str(row) not in order:
-                order.append(row)
-        return order
-
-    def insert_tool_into_tree(self, tool_number, tool_info, pocket_number, disabled_pockets):
-        # Determine if the current pocket is disabled
-        is_disabled = pocket_number in disabled_pockets
-        carousel_pocket = pocket_number if pocket_number <= self.config['Total Pockets'] else ""
-        
-        # Insert disabled pocket or tool info
-        if is_disabled:
-            self.tree.insert("", "end", values=(carousel_pocket, "503", "Pocket Disabled", "0", "0"), tags=('disabled',))
-        else:
-            self.tree.insert("", "end", values=(carousel_pocket, tool_number, tool_info["Description (tool_description)"],
-                                                tool_info["Diameter (tool_diameter)"], tool_info.get("Comment (tool_comment)", "0")))
-
-    def on_tree_select(self, event):
-        selected_items = self.tree.selection()
-        if selected_items:
-            selected_item = selected_items[0]  # Assuming single selection
-            tool_number = self.tree.item(selected_item, 'values')[1]  # Adjust index based on "Tool Number" position
-            
-            # Load and display the image associated with the selected tool number
-            self.display_image_for_tool(tool_number)
-
-    def export_all(self):
-        total_pockets = self.config['Total Pockets']
-
-        # Clear existing selection
-        self.tree.selection_remove(self.tree.selection())
-
-        # Select the first N rows, where N is the total pockets
-        for i, item in enumerate(self.tree.get_children(), start=1):
-            if i > total_pockets:
-                break
-            self.tree.selection_add(item)
-
-        # Now, proceed with the export process
-        # This assumes you have a method like export_selection() that handles the actual export
-        self.export_selection()
-
-    def export_selection(self):
-        # Path for the export file
-        export_path = Path(__file__).parent / "tool.tbl"
-
-        # Prepare the initial list of tools for export, defaulting to "Empty"
-        total_pockets = self.config['Total Pockets']
-        export_data = [("404", "Empty", "0", "0") for _ in range(total_pockets)]
-
-        # Mark disabled pockets
-        for pocket in self.config['Disabled Pockets']:
-            if pocket <= total_pockets:  # Only consider disabled pockets within the total pockets range
-                export_data[pocket - 1] = ("503", "Pocket Disabled", "0", "0")  # Adjust indices for 0-based indexing
-
-        # Process selected items for export
-        selected_items = self.tree.selection()
-        for item in selected_items:
-            # Assuming the first column in Treeview is the pocket number (1-based indexing)
-            pocket_number, tool_number, description, diameter, comment = self.tree.item(item, 'values')
-            pocket_index = int(pocket_number) - 1  # Convert to 0-based index
-            if pocket_index < total_pockets:
-                # Update the export data for the selected pocket
-                diameter_value = diameter.split()[0]  # Extract numerical part of the diameter
-                export_data[pocket_index] = (tool_number, description, diameter_value, comment)
-
-        # Append tools from the Manual Tool Range
-        manual_tool_range_start, manual_tool_range_end = self.config['Manual Tool Range']
-        
-        for tool_number, tool_info in sorted(self.csv_data.items(), key=lambda x: int(x[0])):
-            if manual_tool_range_start <= int(tool_number) <= manual_tool_range_end:
-                # Ensure the tool is not already included
-                if not any(tool[0] == tool_number for tool in export_data):
-                    diameter_value = tool_info['Diameter (tool_diameter)'].split()[0]  # Assuming structure
-                    export_data.append((tool_number, tool_info["Description (tool_description)"],
-                                        diameter_value, tool_info.get("Comment (tool_comment)", "0")))
-
-        # Write to the export file
-        with open(export_path, 'w') as file:
-            for tool_number, description, diameter, comment in export_data:
-                # Adjust line format as needed
-                line = f"T{tool_number} P{tool_number} X0 Y0 Z{comment} A0 B0 C0 U0 V0 W0 D{diameter} I0 J0 Q0 ;{description}\n"
-                file.write(line)
-
-        self.save_current_order()
-        messagebox.showinfo("Export Successful", f"Tools exported successfully to {export_path.name}")
-
-    def generate_tool_tbl(self, selected_tools, file_name):
-        formatted_lines = []
-        for tool in selected_tools:
-            tool_number, description, diameter_unit, comment = tool
-            diameter, unit = diameter_unit.rsplit(' ', 1)
-            diameter = float(diameter)
-            if unit == "in":
-                diameter *= 25.4  # Convert inches to mm
-            z_value = comment if comment else 0
-            formatted_line = f"T{tool_number} P{tool_number} X0 Y0 Z{z_value} A0 B0 C0 U0 V0 W0 D{diameter:.2f} I0 J0 Q0 ;{description}"
-            formatted_lines.append(formatted_line)
-
-        with open(file_name, "w") as file:
-            file.write("\n".join(formatted_lines))
-        messagebox.showinfo("Success", "Tools exported successfully to tool.tbl.")
-
-    def update_library_with_z_values(self):
-        # Determine the directory where this script is located
-        script_directory = Path(__file__).parent
-
-        # Define the paths to the library.csv and tool.tbl files
-        library_csv_path = script_directory / 'library.csv'
-        tool_tbl_path = script_directory / 'tool.tbl'
-    
-        # Step 1: Read tool.tbl and collect Z values
-        z_values = {}  # Dictionary to hold tool_number: Z value pairs
-        with open(tool_tbl_path, 'r') as tbl_file:
-            for line in tbl_file:
-                parts = line.split()
-                tool_number = parts[0][1:]  # Assuming tool number follows 'T' (e.g., T1 -> 1)
-                z_value = parts[4][1:]  # Assuming Z value follows 'Z' and is the 8th element
-                if z_value == '':
-                        z_value = 0
-                z_values[tool_number] = z_value
-         
-        # Step 2: Read library.csv and prepare updates
-        updated_rows = []
-        with open(library_csv_path, 'r', newline='') as csv_file:
-            reader = csv.reader(csv_file)
-            headers = next(reader)
-            updated_rows.append(headers)
-
-            condition_column = headers.index("Number (tool_number)")
-            update_column = headers.index("Comment (tool_comment)")
-            for row in reader:
-                if row and len(row) > condition_column:
-                    if row[condition_column] == tool_number:
-                        if len(row) > update_column:
-                            row[update_column] = z_values[tool_number]
-                updated_rows.append(row)
-            
-        # Step 3: Write updates to library.csv
-        with open(library_csv_path, 'w', newline='') as csv_file:
-            writer = csv.writer(csv_file)
-            writer.writerows(updated_rows)
-
-def main():
-    root = tk.Tk()
-    app = ToolSelectorApp(root)
-    root.geometry("1200x600")  # Adjust the initial size of the window if needed
-    root.mainloop()
-
-if __name__ == "__main__":
-    main()
+import queue
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+from tkinter import messagebox
+from tkinter import filedialog
+from PIL import ImageTk
+from pathlib import Path
+
+import ToolEngine
+import ToolImages
+import ToolTrace
+import ToolWatch
+
+# Seconds of Treeview inserts per event loop turn while populating
+POPULATE_BUDGET = 0.015
+# Milliseconds between checks for Z offsets changed in tool.tbl
+TOOL_TABLE_POLL = 250
+# Milliseconds without layout changes before they are saved
+AUTOSAVE_DELAY = 1000
+# Event.state bits of modifier keys
+SHIFT_MASK = 0x1
+CONTROL_MASK = 0x4
+
+class ToolSelectorApp:
+    def __init__(self, root):
+        with ToolTrace.span("startup"):
+            self.setup(root)
+
+    def setup(self, root):
+        self.root = root
+        self.root.title("Tool Selector")
+        # Thumbnails are decoded on a worker thread; poll for them while any are pending
+        self.thumbnails = ToolImages.ThumbnailCache(Path(__file__).parent / "ToolImages")
+        self.displayed_tool = None
+        self.thumbnail_poll = None
+        self.autosave_job = None
+
+        # Merge Z values from tool.tbl, load the config and library and assign pockets
+        with ToolTrace.span("engine_load"):
+            self.engine = ToolEngine.ToolEngine().load()
+        widgets_started = time.perf_counter()
+        self.config = self.engine.config
+        self.csv_data = self.engine.csv_data
+
+        # Initialize max_selections based on the config
+        self.max_selections = self.engine.max_selections
+
+        # Left side container for the search bar and the tool list
+        self.left_side_container = tk.Frame(root)
+        self.left_side_container.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        # Search bar filtering the tool list as you type, e.g. "ball d:1/4in"
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(self.left_side_container, textvariable=self.search_var)
+        self.search_entry.pack(side=tk.TOP, fill=tk.X)
+        self.search_var.trace_add('write', self.apply_filter)
+        self.filter_matches = None  # Tool numbers to show, None shows every row
+
+        # Setup Treeview on the left side
+        self.tree = ttk.Treeview(self.left_side_container, columns=("Carousel Pocket", "Tool Number", "Description", "Diameter", "Comment"), show="headings")
+        self.tree.heading("Carousel Pocket", text="Carousel Pocket")
+        self.tree.heading("Tool Number", text="Tool Number")
+        self.tree.heading("Description", text="Description")
+        self.tree.heading("Diameter", text="Diameter")
+        self.tree.heading("Comment", text="Z Offset")
+        self.tree.column("Carousel Pocket", width=100, anchor="center")
+        self.tree.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        
+        # Initialize variables
+        self.dragged_items = ()
+        self.disabled_pockets = []  # Assuming this is populated from the config
+        
+        # Bind mouse events for drag-and-drop
+        self.tree.bind('<Button-1>', self.on_item_click)  # Could be adjusted for the specific behavior
+        self.tree.bind('<B1-Motion>', self.on_item_drag)
+        self.tree.bind('<ButtonRelease-1>', self.on_item_drop)
+
+        # Undo and redo tool moves
+        self.root.bind('<Control-z>', self.undo_move)
+        self.root.bind('<Control-y>', self.redo_move)
+        self.root.bind('<Control-Z>', self.redo_move)  # Ctrl+Shift+Z
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Right side container for the export button and image display
+        self.right_side_container = tk.Frame(root, width=400)
+        self.right_side_container.pack(side=tk.RIGHT, fill=tk.BOTH, expand=False)
+
+        # Export button at the top of the right side
+        self.export_button = tk.Button(self.right_side_container, text="Export Selection", command=self.export_selection)
+        self.export_button.pack(pady=10)
+
+        # Add "Export All" button
+        self.export_all_button = tk.Button(self.right_side_container, text="Export All", command=self.export_all)
+        self.export_all_button.pack(pady=10)  # Adjust padding as needed
+
+        # Save tool order button
+        self.toolorder_button = tk.Button(self.right_side_container, text="Save Tool Order", command=self.save_current_order)
+        self.toolorder_button.pack(pady=10)
+
+        # Assign pockets from the tool changes in NC programs
+        self.optimize_button = tk.Button(self.right_side_container, text="Optimize from G-code", command=self.optimize_from_gcode)
+        self.optimize_button.pack(pady=10)
+
+        # Now, create and pack the image label inside the frame without padx/pady
+        self.image_label = tk.Label(self.right_side_container, width=400)
+        self.image_label.pack(fill=tk.BOTH, expand=True)
+
+        self.tree.bind('<<TreeviewSelect>>', self.on_tree_select)
+        ToolTrace.record("build_widgets", widgets_started, time.perf_counter())
+
+        self.populate_job = None
+        self.pending_rows = []
+        self.populated_count = 0
+        self.tree_items = []  # Every inserted item in order, including ones hidden by the filter
+        self.item_positions = {}  # Item -> its row in self.engine.rows
+        self.flagged_positions = set()  # Carousel rows whose tool collides with a neighbour
+        self.restore_selection = set()  # Tools selected last session, reselected as their rows are inserted
+        self.populate_tree()
+
+        # Pick up Z offsets touched off in LinuxCNC while the window is open
+        self.tool_table_watcher = ToolWatch.ToolTableWatcher(self.engine.tool_table_path)
+        # Measurements from a tool presetter, when the config names a Presetter Port, Socket or Folder
+        self.presetter_batches = queue.Queue()
+        self.presetter = self.engine.presetter(self.presetter_batches.put)
+        if self.presetter is not None:
+            try:
+                self.presetter.start()
+            except OSError as error:
+                self.presetter = None
+                messagebox.showwarning("Presetter", f"The presetter service could not start: {error}")
+        self.root.after(TOOL_TABLE_POLL, self.poll_tool_table)
+
+
+    def on_item_click(self, event):
+        """Initiate drag only for non-disabled items; a click on a multi-row selection drags all of it."""
+        item = self.tree.identify_row(event.y)
+        if not item or 'disabled' in self.tree.item(item, 'tags') or event.state & (SHIFT_MASK | CONTROL_MASK):
+            self.dragged_items = ()  # Prevent dragging disabled items, leave Shift/Ctrl clicks to extend the selection
+            return None
+        selection = self.tree.selection()
+        if item in selection and len(selection) > 1:
+            self.dragged_items = selection
+            return "break"  # Keep the selection instead of narrowing it to this row
+        self.dragged_items = (item,)
+        return None
+
+    def on_item_drag(self, event):
+        """Provide visual feedback during dragging or prevent dragging visually if needed."""
+        # This could be expanded with visual feedback, but is not essential for basic functionality
+
+
+    def on_item_drop(self, event):
+        """Move the dragged tools to the drop target, shifting the ones in between.
+
+        'Carousel Pocket' numbers and disabled pockets stay where they are.
+        """
+        dragged_items, self.dragged_items = self.dragged_items, ()
+        if not dragged_items:
+            return  # No item was being dragged
+
+        target_item = self.tree.identify_row(event.y)
+        if not target_item or 'disabled' in self.tree.item(target_item, 'tags'):
+            return  # Drop target is invalid or disabled
+        if target_item in dragged_items:
+            if len(dragged_items) > 1:
+                self.tree.selection_set(target_item)  # A click without a drag narrows the selection after all
+            return
+
+        self.show_change(self.engine.move_rows([self.item_positions[item] for item in dragged_items],
+                                               self.item_positions[target_item]))
+
+    def undo_move(self, event=None):
+        self.show_change(self.engine.undo())
+
+    def redo_move(self, event=None):
+        self.show_change(self.engine.redo())
+
+    def show_change(self, change):
+        """Redraw only the rows a move touched and select the moved tools."""
+        if change is None:
+            return
+        for position in change.changed:
+            if position < len(self.tree_items):  # Rows not inserted yet are drawn from the layout later
+                row = self.engine.rows[position]
+                self.tree.item(self.tree_items[position], values=row[:5], tags=self.row_tags(position, row))
+        self.mark_interference()
+        if self.filter_matches is not None:
+            self.apply_filter()
+        self.tree.selection_set([self.tree_items[position] for position in change.moved
+                                 if position < len(self.tree_items)])
+        self.schedule_autosave()
+
+    def row_tags(self, position, row):
+        return (row.tag, 'interference') if position in self.flagged_positions else (row.tag,)
+
+    def mark_interference(self):
+        """Colour the carousel rows whose tool would collide with a neighbour's."""
+        interference = self.engine.interference()
+        flagged = set()
+        if interference is not None:
+            # The carousel rows come first, one per pocket
+            flagged = {pocket - 1 for pair in interference.pairs for pocket in pair}
+        for position in flagged ^ self.flagged_positions:
+            if position < len(self.tree_items):
+                row = self.engine.rows[position]
+                self.tree.item(self.tree_items[position], tags=(row.tag, 'interference') if position in flagged
+                               else (row.tag,))
+        self.flagged_positions = flagged
+
+    def schedule_autosave(self):
+        """Save the layout once changes have paused, so a burst of edits is one write."""
+        if self.autosave_job is not None:
+            self.root.after_cancel(self.autosave_job)
+        self.autosave_job = self.root.after(AUTOSAVE_DELAY, self.autosave)
+
+    def autosave(self):
+        self.autosave_job = None
+        self.engine.save_order()
+
+    def on_close(self):
+        if self.autosave_job is not None:
+            self.root.after_cancel(self.autosave_job)
+            self.autosave()
+        self.tool_table_watcher.stop()
+        if self.presetter is not None:
+            self.presetter.stop()  # Hands over what it has already received
+            self.apply_presetter_batches()
+        self.root.destroy()
+
+
+    def display_image_for_tool(self, tool_number):
+        self.displayed_tool = tool_number
+        if not self.thumbnails.cached(tool_number):
+            # Show it once the worker has decoded it
+            self.thumbnails.request(tool_number)
+            self.schedule_thumbnail_poll()
+            return
+
+        image = self.thumbnails.get(tool_number)
+        if image:
+            with ToolTrace.span("photo_image", tool=str(tool_number)):
+                photo = ImageTk.PhotoImage(image)
+            self.image_label.config(image=photo)
+            self.image_label.image = photo  # Keep a reference
+        else:
+            self.image_label.config(image='')  # Clear the image if none is found
+            self.image_label.image = None
+
+    def schedule_thumbnail_poll(self):
+        if self.thumbnail_poll is None:
+            self.thumbnail_poll = self.root.after(30, self.poll_thumbnails)
+
+    def poll_thumbnails(self):
+        self.thumbnail_poll = None
+        if self.displayed_tool is not None and self.thumbnails.cached(self.displayed_tool):
+            self.display_image_for_tool(self.displayed_tool)
+        if self.thumbnails.busy():
+            self.schedule_thumbnail_poll()
+
+    def prefetch_neighbours(self, item):
+        """Queue the thumbnails of the rows above and below `item`."""
+        for neighbour in (self.tree.prev(item), self.tree.next(item)):
+            if neighbour:
+                self.thumbnails.request(self.tree.item(neighbour, 'values')[1], ToolImages.PREFETCH)
+
+    def populate_tree(self):
+        """Insert the layout rows in time-boxed batches so the window stays responsive.
+
+        Rows come carousel first, so the first batch (run right away) shows the
+        carousel and the rack rows follow from the event loop.
+        """
+        # Visually distinguish disabled pockets
+        self.tree.tag_configure('disabled', background='indianred')
+        # Optionally, configure empty pockets differently
+        self.tree.tag_configure('empty', background='white')
+        self.tree.tag_configure('carousel', background='skyblue')
+        self.tree.tag_configure('rack', background='gainsboro')
+        self.tree.tag_configure('interference', foreground='red')
+
+        if self.populate_job is not None:
+            self.root.after_cancel(self.populate_job)
+            self.populate_job = None
+        self.tree.delete(*self.tree_items)
+        self.tree_items = []
+        self.item_positions = {}
+        self.flagged_positions = set()
+        self.mark_interference()
+        self.pending_rows = self.engine.rows
+        self.populated_count = 0
+        self.restore_selection = set(self.engine.selection)
+        self.populate_started = time.perf_counter()
+        self.populate_batches = 0
+        self.insert_pending_rows()
+
+    def insert_pending_rows(self):
+        self.populate_job = None
+        self.populate_batches += 1
+        batch_started = time.perf_counter()
+        deadline = batch_started + POPULATE_BUDGET
+        rows = self.pending_rows
+        reselect = []
+        while self.populated_count < len(rows):
+            row = rows[self.populated_count]
+            item = self.tree.insert("", "end", values=row[:5], tags=self.row_tags(self.populated_count, row))
+            self.tree_items.append(item)
+            self.item_positions[item] = self.populated_count
+            if not self.filter_shows(row.tool_number):
+                self.tree.detach(item)
+            elif row.tool_number in self.restore_selection and row.tag in ('carousel', 'rack'):
+                reselect.append(item)
+            self.populated_count += 1
+            if self.populated_count % 64 == 0 and time.perf_counter() > deadline:
+                break
+        if reselect:
+            self.tree.selection_add(reselect)
+        ToolTrace.record("populate_batch", batch_started, time.perf_counter(), rows=self.populated_count)
+        if self.populated_count < len(rows):
+            self.populate_job = self.root.after(1, self.insert_pending_rows)
+        else:
+            ToolTrace.record("populate_tree", self.populate_started, time.perf_counter(),
+                             rows=len(rows), batches=self.populate_batches)
+
+    def poll_tool_table(self):
+        while True:
+            try:
+                z_values = self.tool_table_watcher.changes.get_nowait()
+            except queue.Empty:
+                break
+            self.refresh_tool_rows(self.engine.apply_z_offsets(z_values))
+        self.apply_presetter_batches()
+        self.root.after(TOOL_TABLE_POLL, self.poll_tool_table)
+
+    def apply_presetter_batches(self):
+        while True:
+            try:
+                measurements = self.presetter_batches.get_nowait()
+            except queue.Empty:
+                break
+            changed = self.engine.apply_measurements(measurements)
+            self.refresh_tool_rows(changed)
+            if any('diameter' in values for values in changed.values()):
+                self.mark_interference()
+                if self.filter_matches is not None:
+                    self.apply_filter()  # Diameter searches may match differently now
+
+    def refresh_tool_rows(self, changed):
+        """Update the Diameter and Z Offset cells of the rows showing tools in `changed`."""
+        if not changed:
+            return
+        for item, row in zip(self.tree_items, self.engine.rows):
+            if row.tool_number in changed and row.tag != 'disabled':
+                self.tree.item(item, values=row[:5])
+
+    def filter_shows(self, tool_number):
+        return self.filter_matches is None or str(tool_number) in self.filter_matches
+
+    def apply_filter(self, *args):
+        """Show only the rows whose tool matches the search bar."""
+        with ToolTrace.span("search") as span:
+            self.filter_matches = self.engine.index.search(self.search_var.get())
+            visible = [item for item, row in zip(self.tree_items, self.engine.rows) if self.filter_shows(row.tool_number)]
+            # One Tk call reattaches the matches in order and detaches everything else
+            self.tree.set_children('', *visible)
+            span["visible"] = len(visible)
+
+    def save_current_order(self):
+        self.engine.save_order()
+
+    def on_tree_select(self, event):
+        selected_items = self.tree.selection()
+        selected_rows = [self.engine.rows[self.item_positions[item]] for item in selected_items]
+        self.engine.select(row.tool_number for row in selected_rows if row.tag in ('carousel', 'rack'))
+        self.schedule_autosave()
+        if selected_items:
+            selected_item = selected_items[0]  # Assuming single selection
+            tool_number = self.tree.item(selected_item, 'values')[1]  # Adjust index based on "Tool Number" position
+            
+            # Load and display the image associated with the selected tool number
+            self.display_image_for_tool(tool_number)
+            self.prefetch_neighbours(selected_item)
+
+    def optimize_from_gcode(self):
+        programs = filedialog.askopenfilenames(title="NC programs for this job",
+                                               filetypes=[("NC programs", "*.ngc *.nc *.tap *.gcode"), ("All files", "*")])
+        if not programs:
+            return
+        self.optimize_button.config(state=tk.DISABLED)
+        results = queue.Queue()
+
+        def scan():
+            # Large programs take a while to scan; keep it off the Tk thread
+            try:
+                results.put(self.engine.optimize(programs)[0])
+            except Exception as error:
+                results.put(error)
+
+        threading.Thread(target=scan, name="Optimize", daemon=True).start()
+        self.root.after(100, self.finish_optimize, results)
+
+    def finish_optimize(self, results):
+        try:
+            plan = results.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.finish_optimize, results)
+            return
+        self.optimize_button.config(state=tk.NORMAL)
+        if isinstance(plan, Exception):
+            messagebox.showerror("Optimize failed", str(plan))
+            return
+
+        self.engine.apply_plan(plan)
+        self.search_var.set('')
+        self.populate_tree()
+        message = f"Placed {len(plan.pockets)} tools in the carousel."
+        if plan.manual:
+            message += f"\nChanged by hand: {', '.join(plan.manual)}"
+        messagebox.showinfo("Optimize", message)
+
+    def export_all(self):
+        total_pockets = self.config['Total Pockets']
+
+        # Show every row again so the whole carousel can be selected
+        self.search_var.set('')
+
+        # Clear existing selection
+        self.tree.selection_remove(self.tree.selection())
+
+        # Select the first N rows, where N is the total pockets
+        for i, item in enumerate(self.tree.get_children(), start=1):
+            if i > total_pockets:
+                break
+            self.tree.selection_add(item)
+
+        # Now, proceed with the export process
+        # This assumes you have a method like export_selection() that handles the actual export
+        self.export_selection()
+
+    def export_selection(self):
+        selected_rows = [self.tree.item(item, 'values') for item in self.tree.selection()]
+        interference = self.engine.interference(selected_rows)
+        if interference and (interference.pairs or interference.oversized):
+            warnings = [f"Pockets {first} and {second}: the tools would collide" for first, second in interference.pairs]
+            if interference.oversized:
+                warnings.append(f"Oversized tools, keep their neighbours small or empty: {', '.join(interference.oversized)}")
+            if not messagebox.askyesno("Tool Interference", "\n".join(warnings) + "\n\nExport anyway?", icon='warning'):
+                return
+        export_path, written = self.engine.export(selected_rows)
+        if written:
+            messagebox.showinfo("Export Successful", f"Tools exported successfully to {export_path.name}")
+        else:
+            messagebox.showinfo("Export Successful", f"{export_path.name} already matches the selection, nothing to write")
+
+def main():
+    # --trace/--profile (or TOOLLOADER_TRACE/TOOLLOADER_PROFILE) switch on instrumentation
+    argv = ToolTrace.configure(sys.argv[1:])
+
+    # Any other arguments select a headless command, e.g. "ToolLoader.py export --all"
+    if argv:
+        sys.exit(ToolEngine.main(argv))
+
+    root = tk.Tk()
+    app = ToolSelectorApp(root)
+    root.geometry("1200x600")  # Adjust the initial size of the window if needed
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import multiprocessing
+import re
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Comments are (...) or ; to the end of the line
+GCODE_COMMENT = re.compile(rb'\([^)\n]*\)|;[^\n]*')
+# Newlines end a block; T and M words are the only ones the scanner cares about
+GCODE_WORD = re.compile(rb'\n|([TtMm])[ \t]*(\d+)')
+
+READ_SIZE = 4 * 1024 * 1024
+
+# Improvement passes of the pairwise swap search
+MAX_PASSES = 50
+
+JobPlan = namedtuple("JobPlan", "program tools load unload pockets manual")
+
+
+def scan_program(path):
+    """Return the tool change sequence of an NC program.
+
+    The file is streamed in large blocks. T prepares a tool and M6 changes to
+    the prepared tool at the end of its block, so "M6 T3" and "T3 M6" both
+    load tool 3. Repeated changes to the loaded tool are dropped.
+    """
+    sequence = []
+    prepared = None
+    change_pending = False
+    carry = b''
+    with open(path, 'rb') as program:
+        while True:
+            block = program.read(READ_SIZE)
+            data = carry + block
+            if block:
+                cut = data.rfind(b'\n') + 1
+                data, carry = data[:cut], data[cut:]
+            else:
+                data, carry = data + b'\n', b''
+            for match in GCODE_WORD.finditer(GCODE_COMMENT.sub(b'', data)):
+                letter = match.group(1)
+                if letter is None:
+                    # End of block: carry out a change requested on it
+                    if change_pending and prepared is not None and (not sequence or sequence[-1] != prepared):
+                        sequence.append(prepared)
+                    change_pending = False
+                elif letter in b'Tt':
+                    prepared = str(int(match.group(2)))
+                elif int(match.group(2)) == 6:
+                    change_pending = True
+            if not block:
+                break
+    return sequence
+
+
+def scan_programs(paths, workers=None):
+    """Scan several programs in parallel processes, returning their sequences in order."""
+    paths = [Path(path) for path in paths]
+    if len(paths) <= 1 or workers == 1:
+        return [scan_program(path) for path in paths]
+    # Spawned rather than forked: the GUI calls this from a worker thread, and Tk doesn't survive a fork
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(scan_program, paths))
+
+
+def transition_counts(sequences):
+    """Count tool changes between each unordered pair of tools."""
+    counts = Counter()
+    for sequence in sequences:
+        for previous, following in zip(sequence, sequence[1:]):
+            if previous != following:
+                counts[tuple(sorted((previous, following), key=int))] += 1
+    return counts
+
+
+class Carousel:
+    """Pocket positions of a carousel; the changer rotates the short way round."""
+
+    def __init__(self, total_pockets, disabled_pockets=()):
+        self.total_pockets = total_pockets
+        disabled_pockets = set(disabled_pockets)
+        self.enabled_pockets = [pocket for pocket in range(1, total_pockets + 1) if pocket not in disabled_pockets]
+
+    def distance(self, pocket, other):
+        steps = abs(pocket - other)
+        return min(steps, self.total_pockets - steps)
+
+    def rotation(self, pockets, counts):
+        """Total pockets travelled for `counts` transitions with tools in `pockets`."""
+        return sum(count * self.distance(pockets[a], pockets[b]) for (a, b), count in counts.items()
+                   if a in pockets and b in pockets)
+
+
+def assign_pockets(carousel, counts, tools, fixed=None, positions=None):
+    """Place `tools` in pockets so that the weighted carousel rotation is small.
+
+    `counts` are transition counts from transition_counts; `fixed` maps tools
+    that must stay where they are to their pockets; `positions` limits the
+    pockets that may be used (default: every enabled pocket). Tools are
+    placed greedily next to the tools they change with most, then pairs are
+    swapped (a tool into an empty pocket counts) while that shortens the
+    rotation. Returns {tool: pocket}.
+    """
+    fixed = dict(fixed or {})
+    positions = list(positions if positions is not None else carousel.enabled_pockets)
+    free = [pocket for pocket in positions if pocket not in fixed.values()]
+    movable = [tool for tool in tools if tool not in fixed]
+    if len(movable) > len(free):
+        raise ValueError(f"{len(movable)} tools don't fit in {len(free)} free pockets")
+
+    neighbours = defaultdict(dict)
+    for (a, b), count in counts.items():
+        neighbours[a][b] = neighbours[a].get(b, 0) + count
+        neighbours[b][a] = neighbours[b].get(a, 0) + count
+
+    pockets = dict(fixed)
+
+    def cost(tool, pocket, skip=None):
+        return sum(count * carousel.distance(pocket, pockets[other])
+                   for other, count in neighbours[tool].items() if other in pockets and other != skip)
+
+    # Greedy: busiest tools first, each into the free pocket closest to what it is already linked to
+    for tool in sorted(movable, key=lambda tool: (-sum(neighbours[tool].values()), int(tool))):
+        pocket = min(free, key=lambda pocket: (cost(tool, pocket), pocket))
+        free.remove(pocket)
+        pockets[tool] = pocket
+
+    # Local search: swap two movable tools, or move one into a free pocket, while it helps
+    occupant = {pocket: tool for tool, pocket in pockets.items()}
+    swappable = [pocket for pocket in positions if occupant.get(pocket) not in fixed]
+    for _ in range(MAX_PASSES):
+        improved = False
+        for tool in movable:
+            current = pockets[tool]
+            for pocket in swappable:
+                if pocket == current:
+                    continue
+                other = occupant.get(pocket)
+                delta = cost(tool, pocket, skip=other) - cost(tool, current, skip=other)
+                if other is not None:
+                    delta += cost(other, current, skip=tool) - cost(other, pocket, skip=tool)
+                if delta < 0:
+                    pockets[tool], occupant[pocket] = pocket, tool
+                    if other is None:
+                        del occupant[current]
+                    else:
+                        pockets[other], occupant[current] = current, other
+                    current = pocket
+                    improved = True
+        if not improved:
+            break
+    return pockets
+
+
+def plan_jobs(sequences, capacity, loaded=(), programs=None):
+    """Decide which tools to load and unload before each job in a batch.
+
+    Tools a later job needs are kept in the carousel for as long as possible
+    and the tool needed furthest in the future is unloaded first, which keeps
+    the number of physical swaps down for a fixed job order. Jobs needing more
+    tools than fit keep their most used tools; the rest are reported as
+    manual. Returns a JobPlan per job, without pockets.
+    """
+    loaded = set(loaded)
+    uses = [set(sequence) for sequence in sequences]
+    plans = []
+    for index, sequence in enumerate(sequences):
+        usage = Counter(sequence)
+        first_seen = {}
+        for position, tool in enumerate(sequence):
+            first_seen.setdefault(tool, position)
+        # Of equally used tools, keep the ones already loaded when the job has more tools than fit
+        ranked = sorted(usage, key=lambda tool: (-usage[tool], tool not in loaded, first_seen[tool]))
+        needed = set(ranked[:capacity])
+        load = needed - loaded
+        overflow = len(loaded) + len(load) - capacity
+        unload = set()
+        if overflow > 0:
+            def next_use(tool):
+                for later, later_uses in enumerate(uses[index + 1:], start=index + 1):
+                    if tool in later_uses:
+                        return later
+                return len(uses)
+            candidates = sorted(loaded - needed, key=lambda tool: (-next_use(tool), int(tool)))
+            unload = set(candidates[:overflow])
+        loaded = (loaded - unload) | load
+        program = programs[index] if programs else index + 1
+        plans.append(JobPlan(program, needed, load, unload, None, ranked[capacity:]))
+    return plans
+
+
+def optimize_job(carousel, sequences):
+    """Fresh pocket assignment for one job made of `sequences`, ignoring what is loaded."""
+    usage = Counter(tool for sequence in sequences for tool in sequence)
+    capacity = len(carousel.enabled_pockets)
+    tools = sorted(usage, key=lambda tool: (-usage[tool], int(tool)))
+    pockets = assign_pockets(carousel, transition_counts(sequences), tools[:capacity])
+    return JobPlan(None, set(tools[:capacity]), set(tools[:capacity]), set(), pockets, tools[capacity:])
+
+
+def optimize_batch(carousel, sequences, loaded_pockets, programs=None):
+    """Plan a batch of jobs starting from the tools in `loaded_pockets` ({tool: pocket}).
+
+    Tools that stay loaded keep their pocket so nothing has to be moved by
+    hand; only newly loaded tools are placed, next to the tools they change
+    with most in that job.
+    """
+    pockets = dict(loaded_pockets)
+    plans = []
+    for plan, sequence in zip(plan_jobs(sequences, len(carousel.enabled_pockets), pockets, programs), sequences):
+        kept = {tool: pocket for tool, pocket in pockets.items() if tool not in plan.unload}
+        pockets = assign_pockets(carousel, transition_counts([sequence]), list(kept) + sorted(plan.load, key=int),
+                                 fixed=kept)
+        plans.append(plan._replace(pockets=dict(pockets)))
+    return plans
+
+
+def layout_order(carousel, pockets, current_order):
+    """Turn {tool: pocket} into a tool order for the pocket layout and ToolLoaderState.csv.
+
+    Enabled pockets without a tool are saved as "" so they stay empty, and
+    the remaining tools keep their current relative order after the carousel.
+    """
+    by_pocket = {pocket: tool for tool, pocket in pockets.items()}
+    order = [by_pocket.get(pocket, '') for pocket in carousel.enabled_pockets]
+    # Trailing empties add nothing; the layout pads unused pockets itself
+    while order and order[-1] == '':
+        order.pop()
+    placed = set(pockets)
+    order.extend(tool for tool in current_order if tool not in placed and tool != '')
+    return order
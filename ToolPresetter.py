@@ -0,0 +1,257 @@
+"""Take tool measurements from a presetter over a socket or as dropped CSV files.
+
+Measurements are CSV lines of tool number, length and diameter, in the
+machine's unit. Either value may be left blank, and a header line is skipped:
+
+    tool,length,diameter
+    5,123.456,6.35
+    T7,98.2,
+
+Over TCP or a Unix socket each bad line is answered with "ERROR <line>:
+<reason>" straight away, and "OK <accepted>" follows once the client closes
+its side. Files named *.csv that appear in the drop folder are read once
+their size stops changing, then renamed to *.csv.done, with any bad lines
+listed in *.csv.errors next to them.
+
+Accepted measurements are coalesced: a burst is handed on as one batch once
+the presetter pauses for COALESCE seconds (or MAX_DELAY after the first
+measurement of a steady stream). Only the latest measurement of each tool is
+kept.
+"""
+import asyncio
+import csv
+import math
+import sys
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+import ToolTrace
+
+DEFAULT_HOST = "127.0.0.1"
+# Seconds the presetter has to pause before a burst is applied
+COALESCE = 0.25
+# Seconds a steady stream is held back at most
+MAX_DELAY = 2.0
+# Seconds between looks at the drop folder
+DROP_POLL = 0.5
+# A measured diameter further than this fraction from the library's is taken to be the wrong tool
+DIAMETER_TOLERANCE = 0.2
+# First fields of a header line
+HEADER_NAMES = {"t", "tool", "tool number", "tool_number", "number"}
+
+# One measured tool; a value the presetter didn't send is None
+Measurement = namedtuple("Measurement", "tool_number length diameter")
+
+
+def parse_measurement(fields):
+    """A Measurement from the fields of a CSV line, None for a blank or header line.
+
+    Raises ValueError for anything else that isn't a measurement.
+    """
+    if not fields or not ''.join(fields).strip() or fields[0].strip().lower() in HEADER_NAMES:
+        return None
+    tool_text = fields[0].strip().upper().removeprefix('T')
+    if not tool_text.isdigit():
+        raise ValueError(f"{fields[0]!r} is not a tool number")
+    values = []
+    for text in (list(fields[1:3]) + ['', ''])[:2]:
+        value = float(text) if text.strip() else None
+        if value is not None and not math.isfinite(value):
+            raise ValueError(f"{text.strip()!r} is not a length")
+        values.append(value)
+    length, diameter = values
+    if length is None and diameter is None:
+        raise ValueError("no length or diameter")
+    if diameter is not None and diameter <= 0:
+        raise ValueError(f"diameter {diameter} is not positive")
+    return Measurement(str(int(tool_text)), length, diameter)
+
+
+def merge(earlier, later):
+    """`later`, keeping what only `earlier` measured of the same tool."""
+    return Measurement(later.tool_number, earlier.length if later.length is None else later.length,
+                       earlier.diameter if later.diameter is None else later.diameter)
+
+
+class PresetterService:
+    """asyncio endpoint that validates measurements and hands them on in batches.
+
+    `diameter_of(tool number)` gives a library tool's current diameter in
+    the machine's unit (NaN if unknown), or None for a tool that isn't in
+    the library; measurements of such tools, or with a diameter far off the
+    library's, are rejected. `apply` is called with a list of Measurements
+    per batch, on a worker thread so the endpoint keeps reading meanwhile.
+    Any of `port`, `socket_path` and `drop_folder` can be left out.
+
+    serve() runs the service in the current event loop until stop(); start()
+    runs it on a background thread instead.
+    """
+
+    def __init__(self, diameter_of, apply, host=DEFAULT_HOST, port=None, socket_path=None, drop_folder=None,
+                 coalesce=COALESCE, max_delay=MAX_DELAY):
+        self.diameter_of = diameter_of
+        self.apply = apply
+        self.host = host
+        self.port = port
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.drop_folder = Path(drop_folder) if drop_folder else None
+        self.coalesce_delay = coalesce
+        self.max_delay = max_delay
+
+        self.loop = None
+        self.measurements = None  # asyncio.Queue of accepted Measurements; None asks the batcher to finish
+        self.ports = []  # TCP ports listened on, useful when `port` is 0
+        self.ready = threading.Event()
+        self.error = None  # Why the service couldn't start
+        self.thread = None
+
+    def check(self, measurement):
+        """Raise ValueError unless `measurement` is of a library tool and plausible for it."""
+        nominal = self.diameter_of(measurement.tool_number)
+        if nominal is None:
+            raise ValueError(f"T{measurement.tool_number} is not in the tool library")
+        if (measurement.diameter is not None and not math.isnan(nominal) and nominal > 0
+                and abs(measurement.diameter - nominal) > DIAMETER_TOLERANCE * nominal):
+            raise ValueError(f"T{measurement.tool_number} measured {measurement.diameter} across, "
+                             f"the library has {nominal:g}")
+
+    def ingest(self, line):
+        """Queue the measurement on one line of text; True if there was one, False for blank or header lines."""
+        measurement = parse_measurement(next(csv.reader([line]), []))
+        if measurement is None:
+            return False
+        self.check(measurement)
+        self.measurements.put_nowait(measurement)
+        return True
+
+    async def handle_connection(self, reader, writer):
+        accepted = 0
+        line_number = 0
+        try:
+            async for line in reader:
+                line_number += 1
+                try:
+                    accepted += self.ingest(line.decode('utf-8', 'replace'))
+                except ValueError as error:
+                    writer.write(f"ERROR {line_number}: {error}\n".encode())
+            writer.write(f"OK {accepted}\n".encode())
+            await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass  # The client went away or sent an endless line
+        finally:
+            writer.close()
+
+    def ingest_file(self, path):
+        accepted = 0
+        errors = []
+        with open(path, newline='') as csv_file:
+            for line_number, line in enumerate(csv_file, start=1):
+                try:
+                    accepted += self.ingest(line)
+                except ValueError as error:
+                    errors.append(f"{line_number}: {error}\n")
+        if errors:
+            path.with_name(path.name + ".errors").write_text(''.join(errors))
+        path.replace(path.with_name(path.name + ".done"))
+        return accepted
+
+    async def watch_folder(self):
+        sizes = {}  # Files seen last time -> their size then
+        while True:
+            seen = {}
+            for path in sorted(self.drop_folder.glob("*.csv")):
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    continue
+                if sizes.get(path) != size:
+                    seen[path] = size  # New or still being written, look again next time
+                    continue
+                try:
+                    with ToolTrace.span("presetter_file") as span:
+                        span["measurements"] = self.ingest_file(path)
+                except OSError as error:
+                    print(f"presetter: could not read {path}: {error}", file=sys.stderr)
+            sizes = seen
+            await asyncio.sleep(DROP_POLL)
+
+    async def batch_measurements(self):
+        """Gather measurements into batches and apply each; returns once stop() was called."""
+        stopping = False
+        while not stopping:
+            first = await self.measurements.get()
+            if first is None:
+                return
+            batch = {first.tool_number: first}
+            deadline = self.loop.time() + self.max_delay
+            while True:
+                timeout = min(self.coalesce_delay, deadline - self.loop.time())
+                if timeout <= 0:
+                    break
+                try:
+                    measurement = await asyncio.wait_for(self.measurements.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if measurement is None:
+                    stopping = True  # Apply what has arrived, then finish
+                    break
+                earlier = batch.get(measurement.tool_number)
+                batch[measurement.tool_number] = measurement if earlier is None else merge(earlier, measurement)
+            with ToolTrace.span("presetter_batch", measurements=len(batch)):
+                try:
+                    await asyncio.to_thread(self.apply, list(batch.values()))
+                except OSError as error:
+                    print(f"presetter: could not store {len(batch)} measurements: {error}", file=sys.stderr)
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.measurements = asyncio.Queue()
+        servers = []
+        try:
+            if self.port is not None:
+                servers.append(await asyncio.start_server(self.handle_connection, self.host, self.port))
+                self.ports = [sock.getsockname()[1] for sock in servers[-1].sockets]
+            if self.socket_path:
+                if self.socket_path.is_socket():
+                    self.socket_path.unlink()  # Left behind by a previous run
+                servers.append(await asyncio.start_unix_server(self.handle_connection, self.socket_path))
+            if self.drop_folder:
+                self.drop_folder.mkdir(parents=True, exist_ok=True)
+        except OSError as error:
+            self.error = error
+            for server in servers:
+                server.close()
+            self.ready.set()
+            return
+
+        watcher = asyncio.create_task(self.watch_folder()) if self.drop_folder else None
+        self.ready.set()
+        try:
+            await self.batch_measurements()
+        finally:
+            for server in servers:
+                server.close()
+            if watcher:
+                watcher.cancel()
+            if self.socket_path and self.socket_path.is_socket():
+                self.socket_path.unlink()
+
+    def start(self):
+        """Run the service on a background thread; raises OSError if it can't listen."""
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name="PresetterService", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error:
+            raise self.error
+        return self
+
+    def stop(self):
+        """Apply the measurements already received, then shut down. Safe to call from any thread."""
+        if self.loop is not None and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self.measurements.put_nowait, None)
+            except RuntimeError:
+                pass  # The loop has just finished
+        if self.thread is not None:
+            self.thread.join(timeout=10)
@@ -0,0 +1,164 @@
+import re
+from bisect import bisect_left, insort
+
+import numpy as np
+
+import ToolUnits
+
+# ToolRecord fields whose words can be searched for
+TEXT_FIELDS = ("description", "type", "vendor", "material", "unit", "diameter_text")
+
+# Words are runs of letters and digits, keeping fractions and decimals like 1/8 and 1.25 whole
+TOKEN = re.compile(r'[a-z0-9]+(?:[./][a-z0-9]+)*')
+
+# Diameter filters: d:6, d:6-10, d<6, d>=1/4in ...
+DIAMETER_TERM = re.compile(r'(?:d|dia|diameter)(:|<=|>=|<|>|=)(.+)')
+DIAMETER_VALUE = re.compile(r'(\d+(?:\.\d*)?(?:/\d+)?|\.\d+)\s*(mm|in|")?')
+
+# How close a d:<value> filter has to be, in the machine's unit
+DIAMETER_TOLERANCE = 0.001
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower())
+
+
+def parse_diameter(text, unit=ToolUnits.MILLIMETERS):
+    """Parse "6", "6mm", "0.25in" or "1/4\"" into `unit`; plain numbers are already in `unit`."""
+    match = DIAMETER_VALUE.fullmatch(text.strip())
+    if not match:
+        return None
+    number, mark = match.groups()
+    if '/' in number:
+        numerator, denominator = number.split('/')
+        if float(denominator) == 0:
+            return None
+        value = float(numerator) / float(denominator)
+    else:
+        value = float(number)
+    return ToolUnits.convert(value, ToolUnits.unit_of(mark) if mark else unit, unit)
+
+
+class ToolIndex:
+    """In-memory search index over the tool library.
+
+    Words from the description, type, vendor, material, unit (also as "mm" or
+    "in") and diameter are kept in a sorted token list for prefix lookups, and
+    can be added, changed or removed one tool at a time without rebuilding the
+    index. Diameter filters are answered from the diameter column of `columns`
+    (ToolUnits.ToolColumns), in the machine's unit, sorted once.
+    """
+
+    def __init__(self, tools=None, columns=None):
+        self.postings = {}  # Token -> set of tool numbers
+        self.tool_tokens = {}  # Tool number -> tokens it was indexed under
+        self.sorted_tokens = []
+        self.columns = columns if columns is not None else ToolUnits.ToolColumns({})
+        self.sort_diameters()
+
+        if tools:
+            # Bulk load without keeping the token list sorted, then sort once
+            for tool_number, tool in tools.items():
+                self.add(tool_number, tool, keep_sorted=False)
+            self.sorted_tokens = sorted(self.postings)
+
+    def __len__(self):
+        return len(self.tool_tokens)
+
+    def add(self, tool_number, tool, keep_sorted=True):
+        tokens = set()
+        for field in TEXT_FIELDS:
+            tokens.update(tokenize(getattr(tool, field)))
+        # Fusion spells units out ("millimeters"); index the "mm"/"in" the list shows too
+        unit = ToolUnits.unit_of(tool.unit)
+        if unit:
+            tokens.add(unit)
+        tokens.add(str(tool_number))
+        self.tool_tokens[tool_number] = tokens
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                if keep_sorted:
+                    insort(self.sorted_tokens, token)
+            postings.add(tool_number)
+
+    def remove(self, tool_number):
+        for token in self.tool_tokens.pop(tool_number, ()):
+            postings = self.postings[token]
+            postings.discard(tool_number)
+            if not postings:
+                del self.postings[token]
+                del self.sorted_tokens[bisect_left(self.sorted_tokens, token)]
+
+    def update(self, tool_number, tool):
+        """Re-index one tool after its library row changed."""
+        self.remove(tool_number)
+        self.add(tool_number, tool)
+
+    def sort_diameters(self):
+        """Re-sort the diameter column, after diameters in `columns` changed."""
+        self.diameter_order = np.argsort(self.columns.diameter, kind='stable')  # NaN (no diameter) sorts last
+        self.sorted_diameters = self.columns.diameter[self.diameter_order]
+
+    def prefix_matches(self, prefix):
+        matches = set()
+        sorted_tokens = self.sorted_tokens
+        for position in range(bisect_left(sorted_tokens, prefix), len(sorted_tokens)):
+            token = sorted_tokens[position]
+            if not token.startswith(prefix):
+                break
+            matches |= self.postings[token]
+        return matches
+
+    def diameter_matches(self, low, high):
+        start = np.searchsorted(self.sorted_diameters, low, 'left')
+        end = np.searchsorted(self.sorted_diameters, high, 'right')
+        tool_numbers = self.columns.tool_numbers
+        return {tool_numbers[row] for row in self.diameter_order[start:end].tolist()}
+
+    def diameter_term(self, operator, value_text):
+        """Tools matching a diameter filter; a value that doesn't parse matches nothing."""
+        if operator == ':' and '-' in value_text.strip('-'):
+            low_text, high_text = value_text.split('-', 1)
+            low, high = parse_diameter(low_text, self.columns.unit), parse_diameter(high_text, self.columns.unit)
+            if low is None or high is None:
+                return set()
+            return self.diameter_matches(min(low, high), max(low, high))
+
+        value = parse_diameter(value_text, self.columns.unit)
+        if value is None:
+            return set()
+        if operator in (':', '='):
+            return self.diameter_matches(value - DIAMETER_TOLERANCE, value + DIAMETER_TOLERANCE)
+        if operator == '<':
+            return self.diameter_matches(float('-inf'), value - DIAMETER_TOLERANCE)
+        if operator == '<=':
+            return self.diameter_matches(float('-inf'), value + DIAMETER_TOLERANCE)
+        if operator == '>':
+            return self.diameter_matches(value + DIAMETER_TOLERANCE, float('inf'))
+        return self.diameter_matches(value - DIAMETER_TOLERANCE, float('inf'))
+
+    def search(self, query):
+        """Return the tool numbers matching every term of `query`, or None for an empty query.
+
+        Words match any indexed word they are a prefix of; "d:6-10", "d:1/4in",
+        "d<6" and "d>=0.5in" filter by diameter (in the machine's unit unless marked mm or in).
+        """
+        matches = None
+        for term in query.lower().split():
+            diameter_term = DIAMETER_TERM.fullmatch(term)
+            if diameter_term:
+                term_matches = self.diameter_term(*diameter_term.groups())
+            else:
+                term_matches = set()
+                tokens = tokenize(term)
+                if not tokens:
+                    continue
+                for index, token in enumerate(tokens):
+                    token_matches = self.prefix_matches(token)
+                    term_matches = token_matches if index == 0 else term_matches & token_matches
+            matches = term_matches if matches is None else matches & term_matches
+            if not matches:
+                break
+        return matches
@@ -0,0 +1,156 @@
+import csv
+import os
+from pathlib import Path
+
+import ToolLayout
+
+STATE_SUFFIX = ".state"
+# Where the tool order used to be saved, imported once when a profile has no state yet
+LEGACY_STATE = "ToolLoaderState.csv"
+# Journal records after the snapshot before the file is rewritten as a single snapshot
+COMPACT_AFTER = 500
+
+
+def state_path_for(config_path):
+    """The state file of a config profile: machineA.config keeps its layout in machineA.state."""
+    return Path(config_path).with_suffix(STATE_SUFFIX)
+
+
+def read_legacy_order(state_path):
+    with open(state_path, 'r', newline='') as csvfile:
+        return [row[0] for row in csv.reader(csvfile) if row]
+
+
+def parse_move(fields):
+    destination, *runs = fields
+    return ToolLayout.Move(tuple(tuple(int(value) for value in run.split(':')) for run in runs), int(destination))
+
+
+def format_move(move):
+    return [move.destination] + [f"{start}:{count}" for start, count in move.runs]
+
+
+class LayoutState:
+    """Saved tool order, undo history and selection of one machine profile.
+
+    The file is a journal of CSV records: an "order" snapshot of the layout's
+    slots (see ToolLayout.PocketLayout), then every "move", "undo", "redo" and
+    "selection" since. Undo and redo records carry their move, so they still
+    replay when the move itself was compacted into the snapshot. Records are
+    buffered and appended by flush(), so a burst of edits is one small write;
+    compact() rewrites the file as a single snapshot once the journal grows
+    long.
+    """
+
+    def __init__(self, state_path):
+        self.path = Path(state_path)
+        self.order = None  # Slot order after replaying the journal, None without saved state
+        self.selection = []
+        self.done = []  # Moves since the snapshot that are in effect
+        self.undone = []  # Moves since the snapshot that were undone, latest last
+        self.records = 0  # Journal records after the snapshot, written or not
+        self.pending = []
+        self.stale = False  # The file needs rewriting: imported, damaged or too long
+
+    def load(self, legacy_paths=()):
+        if not self.path.exists():
+            for legacy_path in legacy_paths:
+                if legacy_path.exists():
+                    self.order = read_legacy_order(legacy_path)
+                    self.stale = True
+                    break
+            return self
+
+        with open(self.path, 'r', newline='') as state_file:
+            for record in csv.reader(state_file):
+                try:
+                    self.replay(record)
+                except (ValueError, IndexError, TypeError):
+                    # Most likely a line cut short by a crash; compacting drops it
+                    self.stale = True
+                    break
+        return self
+
+    def replay(self, record):
+        kind, fields = record[0], record[1:]
+        if kind == "order":
+            self.order = fields
+            self.done, self.undone, self.records = [], [], 0
+            return
+        if kind == "selection":
+            self.selection = fields
+        elif kind in ("move", "undo", "redo"):
+            move = parse_move(fields)
+            count = sum(run_count for _, run_count in move.runs)
+            if move.runs[-1][0] + move.runs[-1][1] > len(self.order) or move.destination + count > len(self.order):
+                raise ValueError(f"{kind} {fields} is outside the layout")
+            if kind == "undo":
+                ToolLayout.revert_move(self.order, move)
+                if self.done and self.done[-1] != move:
+                    self.done.clear()  # Out of step with the history, keep only what follows
+                elif self.done:
+                    self.done.pop()
+                self.undone.append(move)
+            else:
+                ToolLayout.apply_move(self.order, move)
+                if kind == "move" or not self.undone or self.undone[-1] != move:
+                    self.undone.clear()
+                else:
+                    self.undone.pop()
+                self.done.append(move)
+        else:
+            raise ValueError(f"unknown state record {kind!r}")
+        self.records += 1
+
+    def resume(self, layout):
+        """Hand the undo history to `layout` if it was built from the saved order, else start afresh."""
+        if self.stale or layout.tools != self.order or self.records > COMPACT_AFTER:
+            self.compact(layout.tools)
+            return
+        layout.journal = self.done + self.undone[::-1]
+        layout.applied = len(self.done)
+
+    def record(self, *fields):
+        self.pending.append(fields)
+        self.records += 1
+
+    def record_move(self, kind, move):
+        """Journal a "move", or the "undo" or "redo" of one."""
+        self.record(kind, *format_move(move))
+
+    def record_selection(self, tool_numbers):
+        tool_numbers = list(tool_numbers)
+        if tool_numbers != self.selection:
+            self.selection = tool_numbers
+            self.record("selection", *tool_numbers)
+
+    def flush(self, order):
+        """Append the pending records; `order` is the current slot order, used if the journal needs compacting."""
+        if self.records > COMPACT_AFTER:
+            self.compact(order)
+            return
+        if not self.pending:
+            return
+        with open(self.path, 'a', newline='') as state_file:
+            csv.writer(state_file).writerows(self.pending)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        self.pending = []
+
+    def compact(self, order):
+        """Replace the journal with a snapshot of `order` and the selection."""
+        self.order = list(order)
+        self.done, self.undone, self.pending, self.records = [], [], [], 0
+        self.stale = False
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(temp_path, 'w', newline='') as state_file:
+                writer = csv.writer(state_file)
+                writer.writerow(["order"] + self.order)
+                writer.writerow(["selection"] + self.selection)
+                state_file.flush()
+                os.fsync(state_file.fileno())
+            os.replace(temp_path, self.path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
@@ -0,0 +1,121 @@
+import os
+import shutil
+from pathlib import Path
+
+# Column order ToolLoader writes; LinuxCNC itself accepts the fields in any order
+FIELD_ORDER = "TPXYZABCUVWDIJQ"
+
+
+class ToolEntry:
+    """One line of a LinuxCNC tool table, as {field letter: value} plus the ;comment.
+
+    Fields keep the order and spelling they were read with, so a parsed table
+    formats back to the same text.
+    """
+
+    __slots__ = ('fields', 'comment')
+
+    def __init__(self, fields, comment=None):
+        self.fields = fields
+        self.comment = comment
+
+    @classmethod
+    def parse(cls, line):
+        data, separator, comment = line.rstrip('\r\n').partition(';')
+        fields = {}
+        for word in data.split():
+            fields[word[0].upper()] = word[1:]
+        return cls(fields, comment if separator else None)
+
+    @property
+    def tool_number(self):
+        tool = self.fields.get('T', '')
+        return str(int(tool)) if tool.isdigit() else None
+
+    def get(self, letter, default=''):
+        return self.fields.get(letter, default)
+
+    def format(self):
+        line = ' '.join(letter + value for letter, value in self.fields.items())
+        if self.comment is not None:
+            line += ' ;' + self.comment if line else ';' + self.comment
+        return line
+
+    def __eq__(self, other):
+        return isinstance(other, ToolEntry) and (self.fields, self.comment) == (other.fields, other.comment)
+
+    def __repr__(self):
+        return f"ToolEntry({self.format()!r})"
+
+
+def tool_entry(tool_number, description, diameter, z_offset):
+    """A tool.tbl entry in ToolLoader's layout, with every other offset zero.
+
+    A blank Z offset is written as Z0, which is what read_z_values reads it back as.
+    """
+    values = {'T': tool_number, 'P': tool_number, 'Z': z_offset or '0', 'D': diameter or '0'}
+    return ToolEntry({letter: str(values.get(letter, '0')) for letter in FIELD_ORDER}, description)
+
+
+def parse_tool_table(text):
+    return [ToolEntry.parse(line) for line in text.splitlines() if line.strip()]
+
+
+def format_tool_table(entries):
+    return ''.join(entry.format() + '\n' for entry in entries)
+
+
+def read_tool_table(tool_tbl_path):
+    tool_tbl_path = Path(tool_tbl_path)
+    if not tool_tbl_path.exists():
+        return []
+    with open(tool_tbl_path, 'r') as tbl_file:
+        return parse_tool_table(tbl_file.read())
+
+
+def read_z_values(tool_tbl_path):
+    """Return {tool number: Z offset} from an existing tool.tbl; a blank Z reads as 0."""
+    z_values = {}
+    for entry in read_tool_table(tool_tbl_path):
+        if entry.tool_number is not None:
+            z_values[entry.tool_number] = entry.get('Z') or '0'
+    return z_values
+
+
+def update_entries(tool_tbl_path, values):
+    """Set fields of tools the table already lists, e.g. {"5": {'Z': "42.1", 'D': "6.35"}}, in one write.
+
+    Tools missing from the table are left out. Returns True if the file was written.
+    """
+    entries = read_tool_table(tool_tbl_path)
+    for entry in entries:
+        entry.fields.update(values.get(entry.tool_number, {}))
+    return bool(entries) and write_tool_table(tool_tbl_path, entries)
+
+
+def write_tool_table(tool_tbl_path, entries, only_if_changed=True):
+    """Write the table in one buffered, atomic replace.
+
+    With `only_if_changed` an identical existing table is left untouched, so
+    LinuxCNC doesn't reload it. Returns True if the file was written.
+    """
+    tool_tbl_path = Path(tool_tbl_path)
+    text = format_tool_table(entries)
+    if only_if_changed and tool_tbl_path.exists():
+        with open(tool_tbl_path, 'r') as tbl_file:
+            if tbl_file.read() == text:
+                return False
+
+    temp_path = tool_tbl_path.with_name(tool_tbl_path.name + ".tmp")
+    try:
+        with open(temp_path, 'w') as tbl_file:
+            tbl_file.write(text)
+            tbl_file.flush()
+            os.fsync(tbl_file.fileno())
+        if tool_tbl_path.exists():
+            shutil.copymode(tool_tbl_path, temp_path)
+        os.replace(temp_path, tool_tbl_path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return True
@@ -0,0 +1,104 @@
+"""Opt-in timing spans and profiling for ToolLoader.
+
+Tracing is off unless switched on, and spans cost next to nothing then:
+
+    TOOLLOADER_TRACE=trace.json python ToolLoader.py      # or: ToolLoader.py --trace trace.json
+    TOOLLOADER_PROFILE=session.prof python ToolLoader.py  # or: ToolLoader.py --profile session.prof
+
+A .json trace is written on exit in Chrome trace event format (open it in
+chrome://tracing or ui.perfetto.dev). A .jsonl trace gets one JSON object per
+span as it finishes, so the log survives a crash. The profile is a cProfile
+capture of the main thread for the whole session, readable with pstats or
+snakeviz.
+"""
+import atexit
+import cProfile
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_ENVIRONMENT = "TOOLLOADER_TRACE"
+PROFILE_ENVIRONMENT = "TOOLLOADER_PROFILE"
+
+trace_path = None
+events = []
+lock = threading.Lock()
+started = time.perf_counter()
+
+
+def enabled():
+    return trace_path is not None
+
+
+def record(name, start, end, **args):
+    """Record a span that ran from `start` to `end` (time.perf_counter values)."""
+    if trace_path is None:
+        return
+    event = {"name": name, "ph": "X", "ts": round((start - started) * 1e6), "dur": round((end - start) * 1e6),
+             "pid": os.getpid(), "tid": threading.get_ident(), "thread": threading.current_thread().name}
+    if args:
+        event["args"] = args
+    with lock:
+        if trace_path.endswith(".jsonl"):
+            with open(trace_path, 'a') as trace_file:
+                trace_file.write(json.dumps(event) + "\n")
+        else:
+            events.append(event)
+
+
+@contextmanager
+def span(name, **args):
+    """Time the enclosed block as `name`; extra keyword arguments are stored with it."""
+    if trace_path is None:
+        yield args
+        return
+    start = time.perf_counter()
+    try:
+        yield args  # The block may add results, e.g. args['rows'] = ...
+    finally:
+        record(name, start, time.perf_counter(), **args)
+
+
+def write_trace():
+    with lock:
+        if trace_path is None or trace_path.endswith(".jsonl"):
+            return
+        with open(trace_path, 'w') as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+
+def start_profile(profile_path):
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def stop():
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+
+    atexit.register(stop)
+
+
+def configure(argv):
+    """Switch tracing/profiling on from --trace/--profile in `argv` or the environment.
+
+    Returns `argv` without those options, for the rest of the command line.
+    """
+    global trace_path
+    options = {"--trace": os.environ.get(TRACE_ENVIRONMENT), "--profile": os.environ.get(PROFILE_ENVIRONMENT)}
+    remaining = []
+    arguments = iter(argv)
+    for argument in arguments:
+        option, equals, value = argument.partition('=')
+        if option in options:
+            options[option] = value if equals else next(arguments, None)
+        else:
+            remaining.append(argument)
+
+    if options["--trace"]:
+        trace_path = options["--trace"]
+        atexit.register(write_trace)
+    if options["--profile"]:
+        start_profile(options["--profile"])
+    return remaining
@@ -0,0 +1,80 @@
+import math
+
+import numpy as np
+
+MILLIMETERS = "mm"
+INCHES = "in"
+MILLIMETERS_PER_INCH = 25.4
+
+# Spellings of each unit in ToolLoader.config, library.csv and search terms
+UNIT_NAMES = {"mm": MILLIMETERS, "millimeter": MILLIMETERS, "millimeters": MILLIMETERS, "metric": MILLIMETERS,
+              "in": INCHES, "inch": INCHES, "inches": INCHES, '"': INCHES, "imperial": INCHES}
+
+# Lengths are shown and exported with this many decimals, trailing zeros dropped
+DECIMALS = {MILLIMETERS: 3, INCHES: 4}
+
+
+def unit_of(text, default=None):
+    """Normalize a unit name ("inches", "mm", ...) to MILLIMETERS or INCHES."""
+    return UNIT_NAMES.get(text.strip().lower(), default)
+
+
+def convert(value, unit, to_unit):
+    if unit == to_unit:
+        return value
+    return value * MILLIMETERS_PER_INCH if unit == INCHES else value / MILLIMETERS_PER_INCH
+
+
+def format_length(value, unit):
+    """Text for a length in `unit`: 6.35 -> "6.35", nan -> ""."""
+    if math.isnan(value):
+        return ''
+    text = f"{value:.{DECIMALS[unit]}f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def number_column(tools, field):
+    return np.fromiter((math.nan if getattr(tool, field) is None else getattr(tool, field) for tool in tools),
+                       dtype=float, count=len(tools))
+
+
+class ToolColumns:
+    """Lengths of every library tool, converted once to the machine's unit.
+
+    Each column is a NumPy array with one entry per tool (NaN where the
+    library has no value), in the order of `tool_numbers`. Tools without a
+    recognised unit are taken to be in the machine's unit already.
+    """
+
+    LENGTHS = ("diameter", "overall_length", "flute_length", "corner_radius")
+
+    def __init__(self, tools, machine_unit=MILLIMETERS):
+        self.unit = machine_unit
+        self.tool_numbers = list(tools)
+        self.rows = {tool_number: row for row, tool_number in enumerate(self.tool_numbers)}
+        records = list(tools.values())
+
+        # Scale factor of each tool's unit to the machine's unit
+        inches = np.fromiter((unit_of(tool.unit, machine_unit) == INCHES for tool in records), dtype=bool,
+                             count=len(records))
+        scale = np.where(inches, convert(1.0, INCHES, machine_unit), convert(1.0, MILLIMETERS, machine_unit))
+        for field in self.LENGTHS:
+            setattr(self, field, number_column(records, field) * scale)
+
+    def __len__(self):
+        return len(self.tool_numbers)
+
+    def length(self, column, tool_number):
+        """Text of one tool's value in `column` ("diameter", "flute_length", ...), "" if unknown."""
+        row = self.rows.get(tool_number)
+        return '' if row is None else format_length(getattr(self, column)[row], self.unit)
+
+    def update(self, tool_number, tool):
+        """Re-read one tool's lengths after its library row changed."""
+        row = self.rows.get(tool_number)
+        if row is None:
+            return
+        scale = convert(1.0, unit_of(tool.unit, self.unit), self.unit)
+        for field in self.LENGTHS:
+            value = getattr(tool, field)
+            getattr(self, field)[row] = math.nan if value is None else value * scale
@@ -0,0 +1,167 @@
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+
+import ToolTable
+import ToolTrace
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+EVENT_HEADER = struct.Struct('iIII')
+
+# A change is only reported once the file has been quiet this long, in seconds
+DEBOUNCE = 0.3
+POLL_INTERVAL = 0.5
+
+
+class InotifySource:
+    """Change notifications for one file from inotify on its directory.
+
+    Watching the directory catches the file being replaced by a rename, which
+    is how LinuxCNC and ToolLoader itself rewrite tool.tbl.
+    """
+
+    def __init__(self, path):
+        self.name = os.fsencode(path.name)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path.parent), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path.parent}")
+
+    def wait(self, timeout):
+        """Return True if the file changed within `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self.fd], [], [], remaining)[0]:
+                return False
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                if data[offset:offset + length].rstrip(b'\0') == self.name:
+                    return True
+                offset += length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Fallback change notifications from comparing the file's mtime and size."""
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = self.stat()
+
+    def stat(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            signature = self.stat()
+            if signature != self.signature:
+                self.signature = signature
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    def close(self):
+        pass
+
+
+def change_source(path):
+    try:
+        return InotifySource(path)
+    except (OSError, AttributeError):
+        # No inotify (not Linux, or no watches left), fall back to polling
+        return PollingSource(path)
+
+
+class ToolTableWatcher:
+    """Watch tool.tbl on a background thread and report Z offsets that changed.
+
+    Bursts of writes are debounced into one refresh. Only lines that differ
+    from the last read are parsed. Changes are put on `changes` as
+    {tool number: Z offset} dicts for the GUI to pick up on its own thread.
+    """
+
+    def __init__(self, tool_tbl_path, debounce=DEBOUNCE):
+        self.path = Path(tool_tbl_path)
+        self.debounce = debounce
+        self.changes = queue.Queue()
+        self.parsed_lines = {}  # Line text -> (tool number, Z offset)
+        self.z_values = {}
+        self.refresh()  # Baseline, so only later changes are reported
+
+        self.stopped = threading.Event()
+        self.source = change_source(self.path)
+        self.thread = threading.Thread(target=self.run, name="ToolTableWatcher", daemon=True)
+        self.thread.start()
+
+    def refresh(self):
+        """Re-read the table and return the {tool number: Z offset} entries that changed."""
+        try:
+            with open(self.path, 'r') as tbl_file:
+                lines = tbl_file.read().splitlines()
+        except OSError:
+            return {}
+
+        parsed_lines = {}
+        z_values = {}
+        for line in lines:
+            parsed = self.parsed_lines.get(line)
+            if parsed is None:
+                entry = ToolTable.ToolEntry.parse(line)
+                parsed = (entry.tool_number, entry.get('Z') or '0')
+            parsed_lines[line] = parsed
+            if parsed[0] is not None:
+                z_values[parsed[0]] = parsed[1]
+
+        changed = {tool_number: z_value for tool_number, z_value in z_values.items()
+                   if self.z_values.get(tool_number) != z_value}
+        self.parsed_lines = parsed_lines
+        self.z_values = z_values
+        return changed
+
+    def run(self):
+        while not self.stopped.is_set():
+            if not self.source.wait(1.0):
+                continue
+            # Let the writer finish: wait until the file stops changing
+            while self.source.wait(self.debounce) and not self.stopped.is_set():
+                pass
+            with ToolTrace.span("tool_table_refresh") as span:
+                changed = self.refresh()
+                span["changed"] = len(changed)
+            if changed:
+                self.changes.put(changed)
+        self.source.close()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,223 @@
+"""Time each ToolLoader phase on synthetic libraries and flag slowdowns.
+
+    python benchmarks/benchmark.py                        # 1k and 10k preset rows
+    python benchmarks/benchmark.py --sizes 1000,100000 --images 20
+    python benchmarks/benchmark.py --save-baseline        # record this machine's numbers
+    python benchmarks/benchmark.py --check                # fail if slower than the baseline
+
+Every phase reports the best of --repeat runs, in seconds. Results go to
+benchmarks/results/latest.json; --check exits with 1 when a phase takes more
+than --tolerance times its baseline.
+"""
+import argparse
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import synthetic  # Also puts the repository on sys.path
+
+import ToolEngine
+import ToolGeometry
+import ToolLibrary
+import ToolPresetter
+import ToolSearch
+import ToolState
+import ToolTable
+import ToolUnits
+
+BENCHMARK_DIRECTORY = Path(__file__).resolve().parent
+RESULTS_DIRECTORY = BENCHMARK_DIRECTORY / "results"
+BASELINE_PATH = BENCHMARK_DIRECTORY / "baseline.json"
+
+# Phases faster than this are too noisy to fail a check on
+MINIMUM_CHECKED = 0.005
+
+
+def best_of(repeat, function, setup=None):
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class StubTree:
+    """Stand-in for ttk.Treeview where no display is available."""
+
+    def __init__(self):
+        self.items = []
+
+    def insert(self, parent, index, values=(), tags=()):
+        self.items.append((values, tags))
+        return f"I{len(self.items)}"
+
+    def get_children(self):
+        return [f"I{index}" for index in range(1, len(self.items) + 1)]
+
+    def delete(self, *items):
+        self.items.clear()
+
+
+def make_tree():
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+        root = tk.Tk()
+        root.withdraw()
+        return ttk.Treeview(root, columns=("Carousel Pocket", "Tool Number", "Description", "Diameter", "Comment"),
+                            show="headings"), "tk"
+    except Exception:
+        return StubTree(), "stub"
+
+
+def run_size(directory, preset_rows, images, repeat, tree, tree_kind):
+    tool_count = synthetic.generate_dataset(directory, preset_rows, images)
+    config_path = directory / "ToolLoader.config"
+    library_path = directory / "library.csv"
+    tool_tbl_path = directory / "tool.tbl"
+    pristine_library = directory / "library.pristine.csv"
+    shutil.copyfile(library_path, pristine_library)
+    cache_path = ToolLibrary.cache_path_for(library_path)
+
+    def reset_library():
+        shutil.copyfile(pristine_library, library_path)
+        cache_path.unlink(missing_ok=True)
+
+    results = {"tools": tool_count, "preset_rows": preset_rows, "tree": tree_kind}
+    results["parse_config"] = best_of(repeat, lambda: ToolEngine.parse_config(config_path))
+    results["load_csv_cold"] = best_of(repeat, lambda: ToolLibrary.load_library(library_path), reset_library)
+    results["load_csv_cached"] = best_of(repeat, lambda: ToolLibrary.load_library(library_path))
+
+    z_values = ToolTable.read_z_values(tool_tbl_path)
+    results["read_tool_table"] = best_of(repeat, lambda: ToolTable.read_z_values(tool_tbl_path))
+    results["update_library_with_z_values"] = best_of(
+        repeat, lambda: ToolLibrary.merge_z_offsets(library_path, z_values), reset_library)
+    results["update_library_unchanged"] = best_of(repeat, lambda: ToolLibrary.merge_z_offsets(library_path, z_values))
+
+    engine = ToolEngine.ToolEngine(config_path).load()
+    tool_order = ToolEngine.complete_order(engine.state.order, engine.csv_data)
+    results["normalize_units"] = best_of(repeat, lambda: ToolUnits.ToolColumns(engine.csv_data, ToolUnits.MILLIMETERS))
+    results["build_layout"] = best_of(repeat, lambda: ToolEngine.build_layout(engine.config, engine.csv_data, tool_order,
+                                                                              engine.columns))
+
+    # A journal as long as it gets before compaction, half moves and half undo/redo
+    random_moves = random.Random(0)
+    for _ in range(ToolState.COMPACT_AFTER // 2):
+        positions = random_moves.sample(range(len(engine.rows)), random_moves.randint(1, 4))
+        engine.move_rows(positions, random_moves.randrange(len(engine.rows)))
+        if random_moves.random() < 0.5:
+            engine.undo()
+        else:
+            engine.redo()
+    engine.save_order()
+    results["load_state_journal"] = best_of(repeat, lambda: ToolState.LayoutState(engine.state_path).load())
+
+    # Profiles built from scratch, then the re-check after every drag with them cached
+    def reset_envelopes():
+        engine.envelopes = ToolGeometry.ToolEnvelopes(engine.csv_data, engine.config['Machine Units'])
+    results["interference_cold"] = best_of(repeat, engine.interference, reset_envelopes)
+    results["interference_check"] = best_of(repeat, engine.interference)
+
+    def populate():
+        for row in engine.rows:
+            tree.insert("", "end", values=row[:5], tags=(row.tag,))
+    results["populate_tree"] = best_of(repeat, populate, lambda: tree.delete(*tree.get_children()))
+
+    results["search_index"] = best_of(repeat, lambda: ToolSearch.ToolIndex(engine.csv_data, engine.columns))
+    results["search_query"] = best_of(repeat, lambda: engine.index.search("end carb d:1/8in-1/2in"))
+
+    export_path = directory / "tool.export.tbl"
+    export_path.unlink(missing_ok=True)
+    results["export_selection"] = best_of(repeat, lambda: engine.export(engine.carousel_rows(), export_path),
+                                          lambda: export_path.unlink(missing_ok=True))
+    results["export_unchanged"] = best_of(repeat, lambda: engine.export(engine.carousel_rows(), export_path))
+
+    # A presetter batch of 300 fresh measurements, written to library.csv and tool.tbl at once
+    measurements = []
+
+    def measure():
+        measurements[:] = [ToolPresetter.Measurement(random_moves.choice(engine.columns.tool_numbers),
+                                                     round(random_moves.uniform(30, 150), 3), None)
+                           for _ in range(300)]
+    results["apply_measurements"] = best_of(repeat, lambda: engine.apply_measurements(measurements), measure)
+
+    if images:
+        import ToolImages
+
+        image_directory = directory / "ToolImages"
+
+        def decode():
+            cache = ToolImages.ThumbnailCache(image_directory, max_entries=images + 1)
+            for tool_number in range(images):
+                cache.load(cache.image_path(tool_number))
+
+        results["thumbnails_cold"] = best_of(repeat, decode,
+                                             lambda: shutil.rmtree(image_directory / ToolImages.THUMBNAIL_DIRECTORY,
+                                                                   ignore_errors=True))
+        results["thumbnails_cached"] = best_of(repeat, decode)
+    return results
+
+
+def check(results, baseline, tolerance):
+    failures = []
+    for size, phases in results["sizes"].items():
+        for phase, seconds in phases.items():
+            expected = baseline.get("sizes", {}).get(size, {}).get(phase)
+            if not isinstance(seconds, float) or not isinstance(expected, float):
+                continue
+            if seconds > MINIMUM_CHECKED and seconds > expected * tolerance:
+                failures.append(f"{size} rows {phase}: {seconds:.4f}s, baseline {expected:.4f}s")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="comma separated preset row counts")
+    parser.add_argument("--images", type=int, default=0, help="synthetic photos to decode (needs Pillow)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--check", action="store_true", help="compare against the baseline and fail on slowdowns")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown factor for --check")
+    args = parser.parse_args(argv)
+
+    tree, tree_kind = make_tree()
+    results = {"python": platform.python_version(), "machine": platform.node(), "sizes": {}}
+    with tempfile.TemporaryDirectory(prefix="toolloader-bench-") as scratch:
+        for preset_rows in (int(size) for size in args.sizes.split(',')):
+            phases = run_size(Path(scratch) / str(preset_rows), preset_rows, args.images, args.repeat, tree, tree_kind)
+            results["sizes"][str(preset_rows)] = phases
+            print(f"{preset_rows} preset rows ({phases['tools']} tools, {tree_kind} tree)")
+            for phase, seconds in phases.items():
+                if isinstance(seconds, float):
+                    print(f"  {phase:<30} {seconds * 1000:10.2f} ms")
+
+    RESULTS_DIRECTORY.mkdir(exist_ok=True)
+    with open(RESULTS_DIRECTORY / "latest.json", 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    if args.save_baseline:
+        with open(BASELINE_PATH, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Saved baseline to {BASELINE_PATH}")
+
+    if args.check:
+        if not BASELINE_PATH.exists():
+            print("No baseline yet, run with --save-baseline first")
+            return 1
+        with open(BASELINE_PATH) as baseline_file:
+            failures = check(results, json.load(baseline_file), args.tolerance)
+        for failure in failures:
+            print(f"SLOWER: {failure}")
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Synthetic ToolLoader inputs for the benchmarks.
+
+Library rows are cloned from the sample library.csv next to ToolLoader.py, so
+they carry Fusion 360's full column set and quoting, with tool numbers,
+descriptions, diameters and presets varied per tool.
+"""
+import csv
+import random
+import re
+import sys
+from pathlib import Path
+
+REPO_DIRECTORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIRECTORY))
+
+SAMPLE_LIBRARY = REPO_DIRECTORY / "library.csv"
+
+PRESETS = ["Default preset"] + [f"{material} - {operation}"
+                                for material in ("Aluminum", "Brass", "Copper", "Plastics", "Stainless Steel", "Low Carbon Steel")
+                                for operation in ("Drilling", "Finishing", "Roughing", "Slotting")]
+TOOL_TYPES = ["flat end mill", "ball end mill", "bull nose end mill", "chamfer mill", "drill", "face mill", "thread mill"]
+VENDORS = ["Lakeshore Carbide", "YG-1", "SPEED TIGER", "WEN", "Harvey", "OSG", ""]
+MATERIALS = ["carbide", "hss", "unspecified"]
+
+# Fusion writes numbers and booleans bare and quotes everything else
+BARE_VALUE = re.compile(r'-?\d+(\.\d*)?([eE][-+]?\d+)?|true|false')
+
+
+def read_sample():
+    with open(SAMPLE_LIBRARY, newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        headers = next(reader)
+        templates = [row for row in reader if row]
+    return headers, templates
+
+
+def fusion_row(row):
+    return ','.join(value if BARE_VALUE.fullmatch(value) else '"' + value.replace('"', '""') + '"'
+                    for value in row) + '\r\n'
+
+
+def generate_library(path, preset_rows, presets_per_tool=25, seed=0):
+    """Write a Fusion-format library.csv with `preset_rows` rows; returns the tool count."""
+    random.seed(seed)
+    headers, templates = read_sample()
+    column = {name: index for index, name in enumerate(headers)}
+    tool_count = max(1, preset_rows // presets_per_tool)
+
+    with open(path, 'w', newline='') as csv_file:
+        csv_file.write(','.join('"' + name + '"' for name in headers) + '\r\n')
+        written = 0
+        for tool_number in range(tool_count):
+            template = list(random.choice(templates))
+            inches = random.random() < 0.7
+            diameter = random.choice([0.0625, 0.125, 0.1875, 0.25, 0.375, 0.5, 0.625, 0.75, 1.0]) if inches \
+                else random.choice([1, 2, 3, 4, 5, 6, 8, 10, 12, 16, 20, 50])
+            tool_type = random.choice(TOOL_TYPES)
+            template[column["Number (tool_number)"]] = str(tool_number)
+            template[column["Unit (tool_unit)"]] = "inches" if inches else "millimeters"
+            template[column["Diameter (tool_diameter)"]] = str(diameter)
+            template[column["Type (tool_type)"]] = tool_type
+            unit_mark = '"' if inches else 'mm'
+            template[column["Description (tool_description)"]] = f"{diameter}{unit_mark} {tool_type.title()} #{tool_number}"
+            template[column["Vendor (tool_vendor)"]] = random.choice(VENDORS)
+            template[column["Material (tool_material)"]] = random.choice(MATERIALS)
+            template[column["Comment (tool_comment)"]] = ""
+            for preset in range(presets_per_tool):
+                if written >= preset_rows:
+                    break
+                template[column["Preset Name (preset_name)"]] = PRESETS[preset % len(PRESETS)]
+                csv_file.write(fusion_row(template))
+                written += 1
+    return tool_count
+
+
+def generate_tool_table(path, tool_count, seed=0):
+    """Write a tool.tbl with every tool and a Z offset for roughly half of them."""
+    random.seed(seed)
+    with open(path, 'w') as tbl_file:
+        for tool_number in range(tool_count):
+            z_value = f"{random.uniform(20, 150):.4f}" if random.random() < 0.5 else "0"
+            tbl_file.write(f"T{tool_number} P{tool_number} X0 Y0 Z{z_value} A0 B0 C0 U0 V0 W0 D0.25 I0 J0 Q0 ;Tool {tool_number}\n")
+
+
+def generate_config(path, tool_count, total_pockets=120, disabled_every=7):
+    disabled = [str(pocket) for pocket in range(disabled_every, total_pockets + 1, disabled_every)]
+    changer_end = max(0, tool_count // 2 - 1)
+    with open(path, 'w') as config_file:
+        config_file.write(f"Total Pockets: {total_pockets}\n")
+        config_file.write(f"Disabled Pockets: {', '.join(disabled)}\n")
+        config_file.write(f"Tool Changer Range: 0-{changer_end}\n")
+        config_file.write(f"Manual Tool Range: {changer_end + 1}-{max(changer_end + 1, tool_count)}\n")
+        config_file.write("Machine Units: mm\nPocket Pitch: 70\nCarousel Radius: 1400")
+
+
+def generate_images(directory, count, size=(3000, 2000), seed=0):
+    """Write `count` high resolution JPEG "vendor photos" plus the No_Image_Available default."""
+    from PIL import Image, ImageDraw
+
+    random.seed(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in [str(tool_number) for tool_number in range(count)] + ["No_Image_Available"]:
+        image = Image.new('RGB', size, tuple(random.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = random.randrange(size[0]), random.randrange(size[1])
+            draw.ellipse((x, y, x + 400, y + 300), fill=tuple(random.randrange(256) for _ in range(3)))
+        image.save(directory / f"{name}.jpg", quality=90)
+
+
+def generate_dataset(directory, preset_rows, images=0):
+    """Create library.csv, tool.tbl, ToolLoader.config and ToolImages/ in `directory`."""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    tool_count = generate_library(directory / "library.csv", preset_rows)
+    generate_tool_table(directory / "tool.tbl", tool_count)
+    generate_config(directory / "ToolLoader.config", tool_count)
+    if images:
+        generate_images(directory / "ToolImages", images)
+    return tool_count